@@ -6,22 +6,34 @@
 # Created:		july 2018
 #-------------------------------------------------------------------------------
 
+import bisect
+import collections
+import contextlib
 import datetime as dt
-from dateutil.relativedelta import relativedelta
+import heapq
+import logging
+import math
+import sys
+import threading
+import time
+import unicodedata
+import zlib
+from array import array
 
-import pytz
-import astral
+# pytz and astral are imported by the functions that need them: importing them costs more than loading the database.
 import csv
+import os
 import re
 
+import dbfile
+import metrics
+
 
 
 #--------------------------------------------------#
 # Global variables                                 #
 #--------------------------------------------------#
 
-db_cities = []
-db_countries = []
 acceptedFormats = (
 ['week', '%A, %H'],
 ['week', '%A, %I%p'],
@@ -48,6 +60,22 @@ link_github_base = 'https://github.com/Ailothaen/ailotime'
 link_github_wiki = 'https://github.com/Ailothaen/ailotime/wiki'
 link_github_issues = 'https://github.com/Ailothaen/ailotime/issues'
 version = '1.0'
+dbDirectory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db')
+logger = logging.getLogger('ailotime')
+database = None # Database, created at the end of this file
+timezones = None # TimezoneRegistry, created at the end of this file
+time_parser = None # TimeParser of acceptedFormats, created at the end of this file
+sun_cache = None # LRUCache of sunEvents(), created at the end of this file
+phase_cache = None # LRUCache of the tables of sunPhases(), created at the end of this file
+time_cache = None # MinuteCache of command_time(), created at the end of this file
+pinned = threading.local() # Database used by the command running in each thread (see pin())
+reloading = threading.Lock() # one reload() at a time
+phase_step = 600 # seconds between two samples of the elevation of the sun in sunPhases()
+timetable_rows = 48 # most rows of a timetable of a!conv
+embed_limit = 2048 # most characters in the description of an answer (Discord limit)
+reminder_limit = 1000 # most characters in the text of a reminder of a!remind
+solar_engine = 'astral' # 'numpy' makes sunrise_sunset() use solar.py (needs NumPy)
+solarEventNames = {'ra': 'dawn_astronomical', 'rn': 'dawn_nautical', 'rc': 'dawn_civil', 'r': 'sunrise', 'sol_n': 'noon', 'sol_m': 'midnight', 's': 'sunset', 'sc': 'dusk_civil', 'sn': 'dusk_nautical', 'sa': 'dusk_astronomical'} # keys of sunrise_sunset() -> names in solar.events()
 
 
 
@@ -59,7 +87,10 @@ class City:
 	"""
 	A city.
 	"""
-	def __init__(self, name=None, countrycode=None, latitude=None, longitude=None, altitude=None, timezone=None):
+	__slots__ = ('id', 'name', 'countrycode', 'latitude', 'longitude', 'altitude', 'timezone_str', 'timezone_pytz')
+	
+	def __init__(self, name=None, countrycode=None, latitude=None, longitude=None, altitude=None, timezone=None, id=None):
+		self.id = id # row in the database, if the city comes from it
 		self.name = name
 		self.countrycode = countrycode
 		self.latitude = latitude
@@ -68,15 +99,248 @@ class City:
 		self.timezone_str = timezone
 		
 		if timezone:
-			try:
-				self.timezone_pytz = pytz.timezone(timezone)
-			except UnknownTimeZoneError:
-				raise
+			self.timezone_pytz = timezones.get(timezone) # shared by every city of this timezone
 	
 	def __repr__(self):
 		return 'name={}, countrycode={}, latitude={}, longitude={}, altitude={}, timezone_str={}, timezone_pytz={}'.format(self.name, self.countrycode, self.latitude, self.longitude, self.altitude, self.timezone_str, self.timezone_pytz)
 
 				
+class CityTable:
+	"""
+	The cities database, stored by columns (one list or array per column of cities.csv).
+	Rows are turned into City objects only when they are asked for.
+	"""
+	__slots__ = ('geonameid', 'name', 'asciiname', 'latitude', 'longitude', 'countrycode', 'altitude', 'timezone', 'population')
+	
+	def __init__(self):
+		self.geonameid = array('i')
+		self.name = []
+		self.asciiname = []
+		self.latitude = array('d')
+		self.longitude = array('d')
+		self.countrycode = [] # interned, there are only ~250 of them
+		self.altitude = array('h')
+		self.timezone = [] # interned, there are only ~400 of them
+		self.population = array('i') # 0 if cities.csv was built without it (rows are still sorted by population)
+	
+	@classmethod
+	def mapped(cls, reader):
+		"""
+		Builds the table on top of a database file (dbfile.Reader), without copying the columns.
+		"""
+		table = cls.__new__(cls)
+		table.geonameid = reader.array('geoid', 'i')
+		table.name = reader.column('name')
+		table.asciiname = reader.column('ascii')
+		table.latitude = reader.array('lat', 'd')
+		table.longitude = reader.array('lon', 'd')
+		table.countrycode = reader.coded('cc')
+		table.altitude = reader.array('alt', 'h')
+		table.timezone = reader.coded('tz')
+		table.population = reader.array('pop', 'i')
+		return table
+	
+	def __len__(self):
+		return len(self.name)
+	
+	def append(self, row):
+		"""
+		Adds a row of cities.csv at the end of the table.
+		"""
+		self.geonameid.append(int(row[0]))
+		self.name.append(row[1])
+		self.asciiname.append(row[1] if row[2] == row[1] else row[2]) # most of the time, the same string
+		self.latitude.append(float(row[3]))
+		self.longitude.append(float(row[4]))
+		self.countrycode.append(sys.intern(row[5]))
+		self.altitude.append(int(row[6]))
+		self.timezone.append(sys.intern(row[7]))
+		self.population.append(int(row[8]) if len(row) > 8 else 0)
+	
+	def city(self, line):
+		"""
+		Builds the City of a row.
+		"""
+		return City(name=self.name[line], countrycode=self.countrycode[line].lower(), latitude=self.latitude[line], longitude=self.longitude[line], altitude=self.altitude[line], timezone=self.timezone[line], id=line)
+	
+	
+class FuzzyIndex:
+	"""
+	Trigram index of the city names, to find the cities closest to a misspelled name.
+	Names are compared without case nor accents; each distinct name points to its most populous city.
+	Built from the table when the database is read from the CSV files, mapped from the database file otherwise (see mapped()).
+	"""
+	maxQuery = 64 # longer names are cut, so that a search stays fast
+	maxCandidates = 64 # names sharing the most trigrams with the one searched, that are then ranked
+	
+	def __init__(self, table):
+		self.table = table
+		self.names = array('i') # row id of the city of each name
+		self.sizes = array('H') # number of trigrams of each name
+		self.trigrams = {} # trigram -> numbers of the names having it
+		
+		seen = set()
+		for i in range(len(table)):
+			for name in (table.name[i], table.asciiname[i]):
+				key = fuzzyKey(name)
+				if key in seen:
+					continue
+				seen.add(key)
+				
+				grams = trigrams(key)
+				for gram in grams:
+					if gram not in self.trigrams:
+						self.trigrams[gram] = array('i')
+					self.trigrams[gram].append(len(self.names))
+				self.names.append(i)
+				self.sizes.append(len(grams))
+	
+	@classmethod
+	def mapped(cls, reader, table):
+		"""
+		Builds the index on top of a database file (dbfile.Reader) written by save(), without copying it.
+		"""
+		index = cls.__new__(cls)
+		index.table = table
+		index.names = reader.array('fzname', 'i')
+		index.sizes = reader.array('fzsize', 'H')
+		index.trigrams = reader.index('idxgram', multiple=True)
+		return index
+	
+	def save(self, writer):
+		"""
+		Adds the index to a database file (dbfile.Writer).
+		"""
+		writer.add_array('fzname', 'i', self.names)
+		writer.add_array('fzsize', 'H', self.sizes)
+		writer.add_index('idxgram', {gram: numbers.tolist() for gram, numbers in self.trigrams.items()})
+	
+	def search(self, place, countrySpecified=None, limit=3, threshold=0.3):
+		"""
+		Returns the row ids of the cities whose names are the closest to place, best first.
+		Cities are ranked by similarity (trigrams in common over all their trigrams), then by population.
+		"""
+		grams = trigrams(fuzzyKey(place[:self.maxQuery]))
+		
+		counts = collections.Counter()
+		for gram in grams:
+			numbers = self.trigrams.get(gram)
+			if numbers is not None:
+				counts.update(numbers)
+		
+		if countrySpecified is not None:
+			counts = {number: shared for number, shared in counts.items() if self.table.countrycode[self.names[number]] == countrySpecified}
+		
+		ranked = []
+		for number, shared in heapq.nlargest(self.maxCandidates, counts.items(), key=lambda item: item[1]):
+			similarity = shared/(len(grams)+self.sizes[number]-shared)
+			if similarity >= threshold:
+				line = self.names[number]
+				ranked.append((-similarity, -self.table.population[line], line))
+		
+		lines = []
+		for _, _, line in sorted(ranked):
+			if line not in lines:
+				lines.append(line)
+		return lines[:limit]
+	
+	
+class NearestIndex:
+	"""
+	KD-tree of the positions of the cities, to find the city nearest to coordinates.
+	Positions are points of the unit sphere (unitVector()), as the straight distance between them grows with the distance on the surface.
+	The tree is implicit: each subtree is a slice of self.lines, split at its middle on the axis of its depth (x, y, z, x...).
+	Built from the table when the database is read from the CSV files, mapped from the database file otherwise (see mapped()).
+	"""
+	def __init__(self, table):
+		self.table = table
+		coordinates = ([], [], [])
+		for latitude, longitude in zip(table.latitude, table.longitude):
+			for axis, value in zip(coordinates, unitVector(latitude, longitude)):
+				axis.append(value)
+		
+		lines = list(range(len(table)))
+		slices = [(0, len(lines), 0)]
+		while slices:
+			low, high, depth = slices.pop()
+			if high-low > 1:
+				lines[low:high] = sorted(lines[low:high], key=coordinates[depth%3].__getitem__)
+				middle = (low+high)//2
+				slices.append((low, middle, depth+1))
+				slices.append((middle+1, high, depth+1))
+		
+		self.lines = array('i', lines) # row id of the city of each node
+		self.coordinates = [array('d', (axis[line] for line in lines)) for axis in coordinates] # x, y, z of each node
+	
+	@classmethod
+	def mapped(cls, reader, table):
+		"""
+		Builds the tree on top of a database file (dbfile.Reader) written by save(), without copying it.
+		"""
+		index = cls.__new__(cls)
+		index.table = table
+		index.lines = reader.array('kdline', 'i')
+		index.coordinates = [reader.array(name, 'd') for name in ('kdx', 'kdy', 'kdz')]
+		return index
+	
+	def save(self, writer):
+		"""
+		Adds the tree to a database file (dbfile.Writer).
+		"""
+		writer.add_array('kdline', 'i', self.lines)
+		for name, axis in zip(('kdx', 'kdy', 'kdz'), self.coordinates):
+			writer.add_array(name, 'd', axis)
+	
+	def nearest(self, latitude, longitude):
+		"""
+		Returns the row id of the city nearest to coordinates (the most populous one if several are as near).
+		"""
+		target = unitVector(latitude, longitude)
+		lines, (xs, ys, zs) = self.lines, self.coordinates
+		best, bestDistance = None, float('inf')
+		
+		slices = [(0, len(lines), 0, 0.0)] # with the least squared distance from target to what the slice can hold
+		while slices:
+			low, high, depth, bound = slices.pop()
+			if low >= high or bound >= bestDistance:
+				continue
+			
+			middle = (low+high)//2
+			x, y, z = target[0]-xs[middle], target[1]-ys[middle], target[2]-zs[middle]
+			distance = x*x+y*y+z*z
+			if distance < bestDistance or (distance == bestDistance and lines[middle] < best):
+				best, bestDistance = lines[middle], distance
+			
+			difference = (x, y, z)[depth%3] # the side of target is searched first, the other one only if it can be nearer
+			if difference < 0:
+				slices.append((middle+1, high, depth+1, difference*difference))
+				slices.append((low, middle, depth+1, 0.0))
+			else:
+				slices.append((low, middle, depth+1, difference*difference))
+				slices.append((middle+1, high, depth+1, 0.0))
+		
+		return best
+	
+	
+class CapitalIndex:
+	"""
+	Index of the countries read from a database file: the City of a capital is built the first time it is asked for.
+	"""
+	def __init__(self, capitals, table):
+		self.capitals = capitals
+		self.table = table
+		self.cities = {}
+	
+	def get(self, key, default=None):
+		line = self.capitals.get(key)
+		if line is None:
+			return default
+		
+		if line not in self.cities:
+			self.cities[line] = self.table.city(line)
+		return self.cities[line]
+	
+	
 class Timezone:
 	"""
 	A timezone in the world
@@ -86,10 +350,7 @@ class Timezone:
 		self.timezone_str = timezone
 		
 		if timezone:
-			try:
-				self.timezone_pytz = pytz.timezone(timezone)
-			except UnknownTimeZoneError:
-				raise
+			self.timezone_pytz = timezones.get(timezone)
 				
 	
 class Output:
@@ -108,66 +369,701 @@ class Output:
 		self.title = title
 		self.description = description
 		self.subfields = subfields
+		self.place = None # City or Timezone found by a!save, for run.py to store it
+		self.reminder = None # (instant, text) of a!remind (instant as a UTC timestamp), for run.py to schedule it
 
 	def __repr__(self):
 		return 'success={}, subtype={}, color={}, title={}, description={}, subfields={}'.format(self.success, self.subtype, self.color, self.title, self.description, self.subfields)
 		
 
+class TimeParser:
+	"""
+	Time formats (like acceptedFormats) compiled into a single regular expression, recognizing all of them in one pass.
+	Each directive matches what strptime() accepts for it: names and AM/PM in any case, one or two digits, and a space matches any whitespace.
+	"""
+	directives = {
+	'A': 'monday|tuesday|wednesday|thursday|friday|saturday|sunday',
+	'd': r'3[01]|[12]\d|0[1-9]|[1-9]| [1-9]',
+	'm': r'1[0-2]|0[1-9]|[1-9]',
+	'Y': r'\d\d\d\d',
+	'H': r'2[0-3]|[0-1]\d|\d',
+	'I': r'1[0-2]|0[1-9]|[1-9]',
+	'M': r'[0-5]\d|\d',
+	'p': r'am|pm'
+	}
+	
+	def __init__(self, formats):
+		self.formats = {} # group of each format -> its type of time, and the group of each of its directives
+		alternatives = []
+		groups = 0
+		
+		for typeOfTime, format in formats:
+			groups += 1
+			first = groups
+			fields = {}
+			pattern = ''
+			for i, part in enumerate(re.split(r'%(\w)', format)):
+				if i % 2:
+					groups += 1
+					fields[part] = groups
+					pattern += '({})'.format(self.directives[part])
+				else:
+					pattern += r'\s+'.join(re.escape(literal) for literal in re.split(r'\s+', part))
+			self.formats[first] = (typeOfTime, fields)
+			alternatives.append('({})'.format(pattern))
+		
+		self.regex = re.compile(r'(?:{})\Z'.format('|'.join(alternatives)), re.IGNORECASE)
+	
+	def parse(self, input):
+		"""
+		Returns the type of time ('week', 'time', 'day' or 'complete') and the fields (weekday, year, month, day, hour, minute) of a time, as integers.
+		Fields that the format does not have are None. Raises ValueError if the time is in no format, or is not a valid date.
+		"""
+		match = self.regex.match(input)
+		if not match:
+			raise ValueError
+		
+		typeOfTime, fields = self.formats[match.lastindex] # the group of the whole format is the last one closed
+		values = {directive: match.group(group) for directive, group in fields.items()}
+		
+		data = {'type': typeOfTime, 'weekday': None, 'year': None, 'month': None, 'day': None, 'hour': None, 'minute': 0}
+		if 'A' in values:
+			data['weekday'] = weekdayName_to_weekdayNumber(values['A'])
+		if 'Y' in values:
+			data['year'], data['month'] = int(values['Y']), int(values['m'])
+		if 'd' in values:
+			data['day'] = int(values['d'])
+		if 'M' in values:
+			data['minute'] = int(values['M'])
+		
+		if 'H' in values:
+			data['hour'] = int(values['H'])
+		else:
+			data['hour'] = int(values['I'])%12 + (12 if values['p'].lower() == 'pm' else 0)
+		
+		if data['year'] is not None:
+			dt.date(data['year'], data['month'], data['day']) # raises ValueError if the date does not exist, like strptime()
+		
+		return data
+
+
+class TimezoneRegistry:
+	"""
+	The timezone identifiers known by pytz, looked up case-insensitively, each with a single pytz timezone shared by everyone.
+	The identifiers are listed at the first lookup; a timezone is created the first time it is asked for.
+	"""
+	def __init__(self):
+		self.identifiers = None # lowercase identifier -> identifier
+		self.timezones = {} # identifier -> pytz timezone
+		self.tables = {} # identifier -> transitions()
+		self.lock = threading.Lock()
+	
+	def identifier(self, name):
+		"""
+		Returns the identifier of a timezone written in any case (europe/paris -> Europe/Paris), None if there is none.
+		"""
+		if self.identifiers is None:
+			import pytz
+			with self.lock:
+				if self.identifiers is None:
+					self.identifiers = {identifier.lower(): identifier for identifier in pytz.all_timezones}
+		return self.identifiers.get(name.lower())
+	
+	def get(self, name):
+		"""
+		Returns the pytz timezone of an identifier written in any case. Raises pytz.UnknownTimeZoneError if there is none.
+		Identifiers written as pytz writes them (like those of the database) are found directly, others through identifier().
+		"""
+		timezone = self.timezones.get(name)
+		if timezone is None:
+			import pytz
+			identifier = self.identifier(name)
+			if identifier is None:
+				raise pytz.UnknownTimeZoneError(name)
+			timezone = self.timezones.get(identifier)
+			if timezone is None:
+				timezone = pytz.timezone(identifier)
+				timezone = self.timezones.setdefault(timezone.zone, timezone)
+		return timezone
+	
+	def transitions(self, timezone):
+		"""
+		Returns the UTC offsets of a pytz timezone through time, as three lists: the instants (timestamps) from which they apply, sorted,
+		the offsets (seconds), and their abbreviations (CET, CEST...). The first one applies since ever, and each one differs from the one
+		before: these are the changes of time. pytz knows them until 2037. Computed once per timezone.
+		"""
+		table = self.tables.get(timezone.zone)
+		if table is None:
+			times = getattr(timezone, '_utc_transition_times', None)
+			if times is None: # fixed offset (UTC, Etc/GMT+5...)
+				table = ([float('-inf')], [int(timezone.utcoffset(dt.datetime(2000, 1, 1)).total_seconds())], [timezone.tzname(dt.datetime(2000, 1, 1))])
+			else:
+				epoch = dt.datetime(1970, 1, 1)
+				table = ([], [], [])
+				for time, (offset, dst, name) in zip(times, timezone._transition_info):
+					offset = int(offset.total_seconds())
+					if not table[1] or offset != table[1][-1]: # only the abbreviation changes otherwise
+						table[0].append((time-epoch).total_seconds() if table[0] else float('-inf'))
+						table[1].append(offset)
+						table[2].append(name)
+			table = self.tables.setdefault(timezone.zone, table)
+		return table
+	
+	def warm(self, names):
+		"""
+		Computes now the transitions() of the timezones of these identifiers (unknown ones are ignored).
+		"""
+		import pytz
+		
+		for name in sorted(set(names)):
+			try:
+				self.transitions(self.get(name))
+			except pytz.UnknownTimeZoneError:
+				pass
+
+
+class LRUCache:
+	"""
+	A dictionary of bounded size: when it is full, the least recently used entry is forgotten.
+	It counts its hits and misses.
+	"""
+	def __init__(self, size):
+		self.size = size
+		self.entries = collections.OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+	
+	def __len__(self):
+		return len(self.entries)
+	
+	def get(self, key, default=None):
+		with self.lock:
+			try:
+				value = self.entries[key]
+			except KeyError:
+				self.misses += 1
+				return default
+			
+			self.entries.move_to_end(key)
+			self.hits += 1
+			return value
+	
+	def put(self, key, value):
+		with self.lock:
+			self.entries[key] = value
+			self.entries.move_to_end(key)
+			if len(self.entries) > self.size:
+				self.entries.popitem(last=False)
+	
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+	
+	def stats(self):
+		return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+	
+	
+class MinuteCache:
+	"""
+	An LRUCache for the current minute only: it is emptied when a new minute starts.
+	Minutes are counted since the epoch, so they start at the same time in every timezone (their offsets are whole minutes).
+	"""
+	def __init__(self, size):
+		self.entries = LRUCache(size)
+		self.current = None
+		self.lock = threading.Lock()
+	
+	def __len__(self):
+		return len(self.entries)
+	
+	@staticmethod
+	def minute():
+		return int(time.time()//60)
+	
+	def get(self, key, minute):
+		"""
+		Returns the value of key stored during minute (which should be minute()), None if there is none.
+		"""
+		if minute != self.current:
+			with self.lock:
+				if self.current is None or minute > self.current:
+					self.entries.clear()
+					self.current = minute
+			return None
+		return self.entries.get(key)
+	
+	def put(self, key, value, minute):
+		"""
+		Stores the value of key computed during minute. It is dropped if another minute has started meanwhile.
+		"""
+		if minute == self.current == self.minute():
+			self.entries.put(key, value)
+	
+	def clear(self):
+		self.entries.clear()
+	
+	def stats(self):
+		return self.entries.stats()
+
+
+class Database:
+	"""
+	The cities and countries database, loaded from a directory (the binary file ailotime.db if there is one, the CSV files otherwise).
+	Nothing is read before the first lookup, or before load() is called. Once loaded, it is never changed (but for the indexes built at
+	the first lookup needing them): reload() replaces the whole object with another one.
+	"""
+	def __init__(self, directory=None):
+		self.directory = directory if directory is not None else dbDirectory
+		self.loaded = False
+		self.lock = threading.Lock()
+		
+		self.cities = None # CityTable
+		self.countries = [] # rows of countries.csv
+		self.index_cities = {} # lowercase name/ASCII name -> row ids of cities, most populous first
+		self.index_cities_cc = {} # (lowercase name/ASCII name, country code) -> row id of the most populous city
+		self.index_countries = {} # lowercase ISO code/country name -> City of its capital
+		self.index_capitals = {} # lowercase ISO code/country name -> row id of its capital
+		self.index_fuzzy = None # FuzzyIndex, read from ailotime.db, or else built at the first misspelled place (or by warm())
+		self.index_nearest = None # NearestIndex, read from ailotime.db, or else built at the first coordinates (or by warm())
+		self.index_aliases = None # lowercase alternate name -> row id of its city, read at the first lookup that needs it
+	
+	def load(self):
+		"""
+		Loads the database if it is not already, and returns it.
+		"""
+		if self.loaded:
+			return self
+		
+		with self.lock:
+			if not self.loaded:
+				path = os.path.join(self.directory, 'ailotime.db')
+				binary = False
+				
+				if os.path.exists(path):
+					try:
+						self.loadBinary(path)
+					except (dbfile.FormatError, OSError) as e:
+						logger.warning('Cannot use %s (%s), reading the CSV files instead', path, e)
+					else:
+						binary = True
+				
+				if not binary:
+					self.loadCSV()
+				self.loaded = True
+		
+		return self
+	
+	def warm(self):
+		"""
+		Builds now the indexes that are otherwise built the first time they are needed, and the changes of time of every timezone of the cities.
+		"""
+		self.load().fuzzy()
+		self.nearest()
+		self.aliases()
+		timezones.warm(self.cities.timezone)
+		return self
+	
+	def fuzzy(self):
+		"""
+		Returns the trigram index of the city names, building it if needed (it is already there if the database was read from ailotime.db).
+		"""
+		if self.index_fuzzy is None:
+			with self.lock:
+				if self.index_fuzzy is None:
+					self.index_fuzzy = FuzzyIndex(self.load().cities)
+		return self.index_fuzzy
+	
+	def nearest(self):
+		"""
+		Returns the KD-tree of the positions of the cities, building it if needed (it is already there if the database was read from ailotime.db).
+		"""
+		if self.index_nearest is None:
+			with self.lock:
+				if self.index_nearest is None:
+					self.index_nearest = NearestIndex(self.load().cities)
+		return self.index_nearest
+	
+	def aliases(self):
+		"""
+		Returns the index of the alternate names (already there if the database was read from ailotime.db, read from aliases.csv otherwise).
+		"""
+		if self.index_aliases is None:
+			with self.lock:
+				if self.index_aliases is None:
+					self.index_aliases = self.loadAliasesCSV()
+		return self.index_aliases
+	
+	def loadAliasesCSV(self):
+		"""
+		Reads aliases.csv (built by util/conversion.py, optional): lines of lowercase alternate name and row id of its city.
+		"""
+		aliases = {}
+		path = os.path.join(self.directory, 'aliases.csv')
+		
+		if os.path.exists(path):
+			with open(path, 'r', encoding='UTF-8') as file:
+				reader = csv.reader(file, delimiter='\t', quoting=csv.QUOTE_NONE)
+				for row in reader:
+					aliases[row[0]] = int(row[1])
+		
+		return aliases
+	
+	def loadCSV(self):
+		"""
+		Loads cities.csv and countries.csv, and builds the indexes.
+		"""
+		import pytz
+		
+		cities = CityTable()
+		countries = []
+		index_cities = {}
+		index_cities_cc = {}
+		index_countries = {}
+		index_capitals = {}
+		
+		with open(os.path.join(self.directory, 'cities.csv'), 'r', encoding='UTF-8') as file:
+			reader = csv.reader(file, delimiter='\t')
+			for row in reader:
+				cities.append(row)
+		
+		# cities.csv is sorted by population, so appending in file order keeps the most populous city first
+		for i in range(len(cities)):
+			for name in cityKeys(cities.name[i], cities.asciiname[i]):
+				index_cities.setdefault(name, []).append(i)
+				index_cities_cc.setdefault((name, cities.countrycode[i]), i)
+	
+		with open(os.path.join(self.directory, 'countries.csv'), 'r', encoding='UTF-8') as file:
+			reader = csv.reader(file, delimiter='\t')
+			for row in reader:
+				countries.append(row)
+		
+		# resolving every capital once, so that looking for a country is a dictionary hit
+		capitals = {}
+		for i in range(len(cities)):
+			capitals.setdefault((cities.asciiname[i], cities.countrycode[i]), i)
+		
+		missing = []
+		for country in countries:
+			if country[0].startswith('#'): # header line
+				continue
+			
+			line = capitals.get((country[3].strip(), country[0]))
+			if line is None:
+				missing.append(country[0])
+				continue
+			
+			try:
+				capital = cities.city(line)
+			except pytz.UnknownTimeZoneError:
+				missing.append(country[0])
+				continue
+			
+			for key in (country[0].lower(), country[2].strip().lower()):
+				index_countries[key] = capital
+				index_capitals[key] = line
+		
+		if missing:
+			logger.warning('No capital found in cities.csv for these countries, they will not be recognized: %s', ', '.join(missing))
+		
+		self.cities = cities
+		self.countries = countries
+		self.index_cities = index_cities
+		self.index_cities_cc = index_cities_cc
+		self.index_countries = index_countries
+		self.index_capitals = index_capitals
+		return missing
+	
+	def loadBinary(self, path):
+		"""
+		Maps a database file built by saveBinary(). Nothing is parsed nor built: columns and indexes (the fuzzy and nearest ones
+		included) are read from the file when used.
+		The file is refused if the CSV files next to it changed since it was built (size and CRC-32 of their contents).
+		"""
+		reader = dbfile.Reader(path)
+		meta = reader.json('meta')
+		
+		for filename, written in meta['sources'].items():
+			if not isinstance(written, list): # only the size, written by a former version
+				raise dbfile.FormatError('built by a former version, without the checksums of the CSV files')
+			source = os.path.join(self.directory, filename)
+			if os.path.exists(source) and sourceSignature(source) != written:
+				raise dbfile.FormatError(filename+' changed since the file was built')
+		
+		self.cities = CityTable.mapped(reader)
+		self.countries = meta['countries']
+		self.index_cities = reader.index('idxname', multiple=True)
+		self.index_cities_cc = reader.index('idxcc', multiple=False)
+		self.index_capitals = reader.index('idxcap', multiple=False)
+		self.index_countries = CapitalIndex(self.index_capitals, self.cities)
+		self.index_aliases = reader.index('idxalias', multiple=False)
+		self.index_fuzzy = FuzzyIndex.mapped(reader, self.cities)
+		self.index_nearest = NearestIndex.mapped(reader, self.cities)
+		
+		if meta['missing']:
+			logger.warning('No capital found in cities.csv for these countries, they will not be recognized: %s', ', '.join(meta['missing']))
+	
+	def saveBinary(self, path):
+		"""
+		Writes the database read from the CSV files into a binary file, readable by loadBinary().
+		"""
+		missing = self.loadCSV()
+		
+		writer = dbfile.Writer()
+		writer.add_json('meta', {
+			'sources': {filename: sourceSignature(os.path.join(self.directory, filename)) for filename in ('cities.csv', 'countries.csv', 'aliases.csv') if os.path.exists(os.path.join(self.directory, filename))},
+			'countries': self.countries,
+			'missing': missing
+		})
+		writer.add_array('geoid', 'i', self.cities.geonameid)
+		writer.add_strings('name', self.cities.name)
+		writer.add_strings('ascii', self.cities.asciiname)
+		writer.add_array('lat', 'd', self.cities.latitude)
+		writer.add_array('lon', 'd', self.cities.longitude)
+		writer.add_coded('cc', self.cities.countrycode)
+		writer.add_array('alt', 'h', self.cities.altitude)
+		writer.add_coded('tz', self.cities.timezone)
+		writer.add_array('pop', 'i', self.cities.population)
+		writer.add_index('idxname', self.index_cities)
+		writer.add_index('idxcc', self.index_cities_cc)
+		writer.add_index('idxcap', self.index_capitals)
+		writer.add_index('idxalias', self.loadAliasesCSV())
+		FuzzyIndex(self.cities).save(writer)
+		NearestIndex(self.cities).save(writer)
+		writer.write(path)
+		
+
 
 #--------------------------------------------------#
 # General functions                                #
 #--------------------------------------------------#
 
-def init():
+def init(directory=None):
 	"""
-	Loads the CSV files into the variables. Called only at script startup.
+	Loads the database and builds its indexes now instead of at the first lookup (from another directory than db/ if one is given).
 	"""
-	global db_cities, db_countries
+	global database
 	
-	with open('db/cities.csv', 'r', encoding='UTF-8') as file:
-		reader = csv.reader(file, delimiter='\t')
-		for row in reader:
-			db_cities.append(row)
+	if directory is not None and directory != database.directory:
+		database = Database(directory)
+	database.warm()
 
-	with open('db/countries.csv', 'r', encoding='UTF-8') as file:
-		reader = csv.reader(file, delimiter='\t')
-		for row in reader:
-			db_countries.append(row)
 
-			
+def reload(directory=None):
+	"""
+	Loads the database again (from the same directory, or from another one if given) and builds its indexes, then makes the commands
+	use it. Commands already running end with the previous one (see pin()). Returns the new Database.
+	If the files cannot be read, the exception is raised and the previous database is still used.
+	"""
+	global database
+	
+	with reloading:
+		fresh = Database(directory if directory is not None else database.directory).warm()
+		database = fresh
+		time_cache.clear() # its answers are those of the previous database (its keys hold it), no need to keep them
+	
+	logger.info('Database reloaded from %s: %s cities', fresh.directory, len(fresh.cities))
+	return fresh
+
+
+def snapshot():
+	"""
+	Returns the loaded Database the lookups should use: the one pinned by the command running in this thread, the current one otherwise.
+	"""
+	db = getattr(pinned, 'database', None)
+	if db is not None:
+		return db
+	return database.load()
+
+
+@contextlib.contextmanager
+def pin():
+	"""
+	Context manager making the lookups of this thread use the current database until the end, even if reload() replaces it meanwhile,
+	so that every place of a command is looked up in the same database.
+	"""
+	previous = getattr(pinned, 'database', None)
+	pinned.database = snapshot()
+	try:
+		yield pinned.database
+	finally:
+		pinned.database = previous
+	
+
+def sourceSignature(path):
+	"""
+	Returns [size, CRC-32 of the contents] of a file, telling whether it changed (the size alone misses changed digits).
+	"""
+	checksum = 0
+	with open(path, 'rb') as file:
+		for block in iter(lambda: file.read(1 << 20), b''):
+			checksum = zlib.crc32(block, checksum)
+	return [os.path.getsize(path), checksum]
+
+
+def cityKeys(name, asciiname):
+	"""
+	Returns the lookup keys of a city (its name and ASCII name, lowercased, without duplicates).
+	"""
+	name = name.lower()
+	asciiname = asciiname.lower()
+	
+	if name == asciiname:
+		return (name,)
+	else:
+		return (name, asciiname)
+	
+
+def fuzzyKey(name):
+	"""
+	Returns a name as compared by the fuzzy search: lowercase, without accents nor punctuation.
+	"""
+	name = ''.join(c for c in unicodedata.normalize('NFKD', name) if not unicodedata.combining(c))
+	return ' '.join(re.sub(r"[\W_]+", ' ', name.lower()).split())
+
+
+def unitVector(latitude, longitude):
+	"""
+	Returns the point of the unit sphere at coordinates (degrees), as (x, y, z).
+	"""
+	latitude, longitude = math.radians(latitude), math.radians(longitude)
+	return (math.cos(latitude)*math.cos(longitude), math.cos(latitude)*math.sin(longitude), math.sin(latitude))
+
+
+def trigrams(key):
+	"""
+	Returns the set of trigrams of a name (words are padded with spaces, so that their beginning counts more).
+	"""
+	padded = '  '+key+' '
+	return {padded[i:i+3] for i in range(len(padded)-2)}
+
+
+def suggestPlaces(place, countrySpecified=None):
+	"""
+	Returns the names (with their country code) of the known cities closest to a place that was not found.
+	"""
+	db = snapshot()
+	countrySpecified = countrySpecified.upper() if countrySpecified is not None else None
+	return ['{} ({})'.format(db.cities.name[line], db.cities.countrycode[line]) for line in db.fuzzy().search(place, countrySpecified)]
+	
+
 def errorMessage(type, **kwargs):
 	"""
 	Raises an error message for the user (as they are always the same). kwargs is supposed to be filled with determ... uh, various variables, depending of the message.
+	The type of error is kept as the subtype of the Output.
 	"""
 	# user errors
 	if type == 'IncorrectPlace':
-		return Output(success=False, subtype=None, color='e84118', title=':warning: Something went wrong', description=['I don\'t know the place {}. Try to write another more known city, or check whether the name is correct.'.format(kwargs['place'])], subfields=None)
+		suggestions = kwargs.get('suggestions')
+		if suggestions:
+			suggestions = suggestions[0] if len(suggestions) == 1 else ', '.join(suggestions[:-1])+' or '+suggestions[-1]
+			return Output(success=False, subtype=type, color='e84118', title=':warning: Something went wrong', description=['I don\'t know the place {}. Did you mean {}?'.format(kwargs['place'], suggestions)], subfields=None)
+		return Output(success=False, subtype=type, color='e84118', title=':warning: Something went wrong', description=['I don\'t know the place {}. Try to write another more known city, or check whether the name is correct.'.format(kwargs['place'])], subfields=None)
 	elif type == 'IncorrectInput':
-		return Output(success=False, subtype=None, color='e84118', title=':warning: Something went wrong', description=['I don\'t understand at all what you wrote. Follow the guide here to properly write your command: {}'.format(link_github_wiki)], subfields=None)
+		return Output(success=False, subtype=type, color='e84118', title=':warning: Something went wrong', description=['I don\'t understand at all what you wrote. Follow the guide here to properly write your command: {}'.format(link_github_wiki)], subfields=None)
 	elif type == 'IncorrectTime':
-		return Output(success=False, subtype=None, color='e84118', title=':warning: Something went wrong', description=['I don\'t understand the time you entered. Follow the guide here to properly write your time: {}'.format(link_github_wiki)], subfields=None)
+		return Output(success=False, subtype=type, color='e84118', title=':warning: Something went wrong', description=['I don\'t understand the time you entered. Follow the guide here to properly write your time: {}'.format(link_github_wiki)], subfields=None)
+	elif type == 'NoSavedPlace':
+		return Output(success=False, subtype=type, color='e84118', title=':warning: Something went wrong', description=['Which place? You did not save one: write `a!save` followed by a place (like `a!save Paris`), and it will be used when you give no place, or "me" as a place.'], subfields=None)
+	elif type == 'PastTime':
+		return Output(success=False, subtype=type, color='e84118', title=':warning: Something went wrong', description=['This time is already past. Give a time to come, like a time of the day, a day of the week or a date.'], subfields=None)
+	elif type == 'IncorrectRange':
+		return Output(success=False, subtype=type, color='e84118', title=':warning: Something went wrong', description=['This timetable is too large for me. Ask for at most {} times, with a larger step or a shorter range, or for fewer places.'.format(timetable_rows)], subfields=None)
+	
+	# the bot is overloaded (see pool.py)
+	elif type == 'Busy':
+		return Output(success=False, subtype=type, color='e84118', title=':hourglass: Too many requests', description=['I am answering too many commands right now. Please try again in a few seconds.'], subfields=None)
+	elif type == 'Timeout':
+		return Output(success=False, subtype=type, color='e84118', title=':hourglass: Too long', description=['Your command took me too long to answer, sorry. Try again later, or with fewer places.'], subfields=None)
 		
 	# more critical errors
 	elif type == 'IncorrectData':
-		return Output(success=False, subtype=None, color='e84118', title=':bangbang: Something went (really) wrong', description=['I found the place you mean, but the data I have seems to be incorrect. Please report the problem by opening an issue on {} with this info:'.format(link_github_issues, kwargs)], subfields=None)
+		return Output(success=False, subtype=type, color='e84118', title=':bangbang: Something went (really) wrong', description=['I found the place you mean, but the data I have seems to be incorrect. Please report the problem by opening an issue on {} with this info:'.format(link_github_issues, kwargs)], subfields=None)
 	else:
-		return Output(success=False, subtype=None, color='e84118', title=':bangbang: Something went (really) wrong', description=['... and I don\'t even know what is it. Please report the problem by opening an issue on {}.'.format(link_github_issues)], subfields=None)
+		return Output(success=False, subtype=type, color='e84118', title=':bangbang: Something went (really) wrong', description=['... and I don\'t even know what is it. Please report the problem by opening an issue on {}.'.format(link_github_issues)], subfields=None)
 	
 		
-def separateCountryCodes(city):
+def tokenize(input):
+	"""
+	Splits a command input into tokens: runs of whitespace, parentheses, commas, and words (runs of anything else).
+	The kind of a token is known from its first character, so the input is read once, whatever it contains: parsing stays linear.
+	"""
+	return re.findall(r"\s+|[(),]|[^\s(),]+", input)
+
+
+def strip(tokens):
 	"""
-	Separates the country code from the city, if provided.
+	Removes the whitespace tokens at both ends.
 	"""
-	re_countrycodes = re.match(r"^([A-Za-z0-9'/\-\s]+)\s?\(([A-Za-z]{2})\)?$", city)
+	start, end = 0, len(tokens)
+	while start < end and tokens[start].isspace():
+		start += 1
+	while end > start and tokens[end-1].isspace():
+		end -= 1
+	return tokens[start:end]
+
+
+def splitAtKeyword(tokens, keywords):
+	"""
+	Splits tokens at the first of keywords written alone between spaces (like "at" in "15:30 at Paris").
+	Returns the tokens before and after it. Raises ValueError if there is none.
+	"""
+	for i in range(1, len(tokens)-1):
+		if tokens[i] in keywords and tokens[i-1].isspace() and tokens[i+1].isspace():
+			return tokens[:i-1], tokens[i+2:]
+	raise ValueError
+
+
+def splitAtCommas(tokens):
+	"""
+	Splits tokens at each comma.
+	"""
+	groups = [[]]
+	for token in tokens:
+		if token == ',':
+			groups.append([])
+		else:
+			groups[-1].append(token)
+	return groups
+
+
+def parse_place_tokens(tokens):
+	"""
+	Returns [place, country code or None] from the tokens of a place, like "Aix-en-Provence (FR)", or coordinates, like "48.85, 2.35"
+	(returned without spaces). Raises ValueError if they are not a place.
+	"""
+	tokens = strip(tokens)
+	countrycode = None
 	
-	if re_countrycodes: # city with country code 
-		re_nottuple = [] # I can't remove extra spaces with a tuple.
-		re_nottuple.append(re_countrycodes.groups()[0].strip())
-		re_nottuple.append(re_countrycodes.groups()[1])
-		return re_nottuple
-	else: # everything else
-		return False
-		
+	words = [token for token in tokens if not token.isspace()]
+	if len(words) == 3 and words[1] == ',' and re.fullmatch(r"[+-]?\d+(?:\.\d+)?", words[0]) and re.fullmatch(r"[+-]?\d+(?:\.\d+)?", words[2]):
+		return [''.join(words), None]
+	
+	if len(tokens) >= 3 and tokens[-3] == '(' and tokens[-1] == ')':
+		countrycode = tokens[-2]
+		if not re.fullmatch(r"[A-Za-z]{2}", countrycode):
+			raise ValueError
+		tokens = strip(tokens[:-3])
+	
+	if not tokens:
+		raise ValueError
+	for token in tokens:
+		if not token.isspace() and not re.fullmatch(r"[\w'’`./+-]+", token):
+			raise ValueError
+	
+	return [''.join(tokens), countrycode]
+
+
+def parse_time_tokens(tokens):
+	"""
+	Returns the time written by tokens (letters, digits, ':', '/', '-', commas and spaces). Raises ValueError if there is something else.
+	It is checked by parse_time() later on. Commas are followed by one space, as in acceptedFormats ("16,9am" is "16, 9am").
+	"""
+	time = ''.join(strip(tokens))
+	if not re.fullmatch(r"[A-Za-z0-9,:/\s-]+", time):
+		raise ValueError
+	return ', '.join(part.strip() for part in time.split(','))
+
 
 def strfdelta(tdelta, fmt):
 	"""
@@ -184,8 +1080,17 @@ def parse_location(place, countrySpecified=None):
 	Returns the correct pytz timezone object for the country, city or timezone identifier.
 	(Country is specified is the place is a city and the user specified it - to avoid homonyms).
 	If there are still city homonyms, the function returns the city with the most inhabitants in it.
+	Coordinates ("latitude,longitude", in degrees) give the nearest city.
 	"""
+	db = snapshot()
 	match = False
+	
+	coordinates = re.fullmatch(r"([+-]?\d+(?:\.\d+)?),([+-]?\d+(?:\.\d+)?)", place)
+	if coordinates:
+		latitude, longitude = float(coordinates.group(1)), float(coordinates.group(2))
+		if abs(latitude) > 90 or abs(longitude) > 180:
+			raise ValueError
+		return db.cities.city(db.nearest().nearest(latitude, longitude))
 	place_lower = place.lower() # lowercase for comparing countries and cities
 	countrySpecified = countrySpecified.upper() if countrySpecified is not None else None # always in uppercase
 	
@@ -194,124 +1099,131 @@ def parse_location(place, countrySpecified=None):
 		place_lower = 'new york city'
 		
 	wrongTimezones = {'PST': 'PST8PDT', 'PDT': 'PST8PDT', 'MST': 'MST7MDT', 'MDT': 'MST7MDT', 'CST': 'CST6CDT', 'CDT': 'CST6CDT', 'EST': 'EST5EDT', 'EDT': 'EST5EDT'}
-	if place in wrongTimezones:
-		place = wrongTimezones[place]
+	if place.upper() in wrongTimezones:
+		place = wrongTimezones[place.upper()]
 	
-	# 1 : searching in cities
-
-	for i, city in enumerate(db_cities):
-		if countrySpecified == None:
-			if city[1].lower() == place_lower or city[2].lower() == place_lower:
-				match = True
-				line = i
-				break
-		else:
-			if(city[1].lower() == place_lower or city[2].lower() == place_lower) and (city[5] == countrySpecified):
-				match = True
-				line = i
-				break
+	# 1 : searching in cities (through the indexes of the database)
 	
-	if match:
-		try:
-			city = City(name=db_cities[line][1], countrycode=db_cities[line][5].lower(), latitude=db_cities[line][3], longitude=db_cities[line][4], altitude=db_cities[line][6], timezone=db_cities[line][7])
-		except UnknownTimeZoneError:
-			raise
-		else:
-			return city
-		
-	# 2 : searching in countries (either name or code). We get their capital if found.
-	
-	for i, country in enumerate(db_countries):
-		if country[0].lower() == place_lower or country[2].lower() == place_lower:
+	if countrySpecified == None:
+		lines = db.index_cities.get(place_lower)
+		if lines:
+			match = True
+			line = lines[0]
+	else:
+		line = db.index_cities_cc.get((place_lower, countrySpecified))
+		if line is not None:
 			match = True
-			line = i
 	
 	if match:
-		capital = db_countries[line][3]
-		countrycode = db_countries[line][0]
-		
-		for i, city in enumerate(db_cities):
-			if city[2] == capital and city[5] == countrycode:
-				line = i
-				break
+		return db.cities.city(line)
 		
-		try:
-			city = City(name=db_cities[line][1], countrycode=db_cities[line][5].lower(), latitude=db_cities[line][3], longitude=db_cities[line][4], altitude=db_cities[line][6], timezone=db_cities[line][7])
-		except UnknownTimeZoneError:
-			raise
-		else:
-			return city
+	# 2 : searching in countries (either name or code). Their capital is resolved when the database is loaded.
+	
+	capital = db.index_countries.get(place_lower)
+	if capital is not None:
+		return capital
 		
-	# 3 : searching in timezone identifiers
+	# 3 : searching in timezone identifiers (in any case)
+	
+	identifier = timezones.identifier(place)
+	if identifier is not None:
+		return Timezone(name=identifier, timezone=identifier)
 	
-	for tz in pytz.all_timezones:
-		if place == tz:
-			# no try/except here, as timezone exists if we're here
-			return Timezone(name=tz, timezone=tz)
+	# 4 : searching in alternate names of cities (other languages, former names...). Last, so that they never hide anything above.
+	
+	line = db.aliases().get(place_lower)
+	if line is not None and (countrySpecified == None or db.cities.countrycode[line] == countrySpecified):
+		return db.cities.city(line)
 	
 	# Definitely not found.
 	raise ValueError
 
 
-def parse_time(input, timezone):
+def locate(place, saved=None):
+	"""
+	Returns parse_location() of place (as given by parse_place_tokens()), or the saved place of the user (City or Timezone, see
+	locations.py) if there is no place or "me" ("me" is Montenegro for those who saved nothing).
+	Raises ValueError like parse_location(), LookupError if there is no place and nothing saved.
+	"""
+	if place[1] is None and place[0].lower() in ('', 'me'):
+		if saved is not None:
+			return saved
+		if not place[0]:
+			raise LookupError
+	return parse_location(*place)
+
+
+def inputKey(input, saved=None):
+	"""
+	Returns what identifies the answer of a command handler given input and saved (see locate()): commands of the same key have
+	the same answer. Spaces around the input change nothing, and the saved place only matters without a place, or with "me".
+	"""
+	input = input.strip()
+	if saved is not None and (not input or re.search(r"(?<!\w)me(?!\w)", input, re.IGNORECASE)):
+		return (input, saved.name, saved.timezone_str, getattr(saved, 'latitude', None), getattr(saved, 'longitude', None))
+	return input
+
+
+def parse_time(input, timezone, future=False):
 	"""
 	Returns a correct DateTime object for the time supplied in argument.
 	Returns, as well, an appropriate format for the output formatting, depending on the "scope".
+	A day of the month is the next one to come (see nextDayOfMonth()).
+	If future is True, a time of the day already past today is taken tomorrow, and a day of the week already past is taken next week.
 	"""
-	timezone_pytz = pytz.timezone(timezone)
+	timezone_pytz = timezones.get(timezone)
 	now = dt.datetime.now(timezone_pytz)
 	
-	parsed = False
-	typeOfTime = None
-	
-	# testing to parse with all the formats
-	for format in acceptedFormats:
-		try:
-			# IMPORTANT : do not work directly on this date object! In most cases, the year here is equal to "1900", which cause great problems with historic timezones arrangements
-			parsed = dt.datetime.strptime(input, format[1])
-		except ValueError:
-			pass
-		else:
-			typeOfTime = format[0]
-			break
+	parsed = time_parser.parse(input) # raises ValueError if the time is in no accepted format
+	typeOfTime = parsed['type']
 	
-	if not parsed: # if no one is okay
-		raise ValueError
-	else:
-		if typeOfTime == 'week':
-			outputFormat = '%A %d, %H:%M'
+	if typeOfTime == 'week':
+		outputFormat = '%A %d, %H:%M'
 		
-			# Here we find the next occurence of day-of-week. Don't forget to look at the source current time!
-			re_weekday = re.match(r"^([A-Za-z]+),", input)
-			weekdayNumber = weekdayName_to_weekdayNumber(re_weekday.groups()[0])
-			nextday = now + dt.timedelta(days=(weekdayNumber-now.weekday()+7)%7)
-			
-			dtObject = dt.datetime(year=int(nextday.strftime('%Y')), month=int(nextday.strftime('%m')), day=int(nextday.strftime('%d')), hour=int(parsed.strftime('%H')), minute=int(parsed.strftime('%M')), second=0)
-			
-		elif typeOfTime == 'time':
-			outputFormat = '%A, %H:%M'
+		# Here we find the next occurence of day-of-week. Don't forget to look at the source current time!
+		nextday = now + dt.timedelta(days=(parsed['weekday']-now.weekday()+7)%7)
+		dtObject = dt.datetime(nextday.year, nextday.month, nextday.day, parsed['hour'], parsed['minute'])
 		
-			dtObject = dt.datetime(year=int(now.strftime('%Y')), month=int(now.strftime('%m')), day=int(now.strftime('%d')), hour=int(parsed.strftime('%H')), minute=int(parsed.strftime('%M')), second=0)
-			
-		elif typeOfTime == 'day':
-			outputFormat = '%B %d, %H:%M'
+		if future and timezone_pytz.localize(dtObject) <= now:
+			dtObject += dt.timedelta(days=7)
 		
-			 # We check if the day-of-month and time is already passed.
-			dtObject_compare = dt.datetime(year=int(now.strftime('%Y')), month=int(now.strftime('%m')), day=int(parsed.strftime('%d')), hour=int(parsed.strftime('%H')), minute=int(parsed.strftime('%M')), second=0)
-			dtObject_compare = timezone_pytz.localize(dtObject_compare)
-			
-			dtObject = dt.datetime(year=int(now.strftime('%Y')), month=int(now.strftime('%m')), day=int(parsed.strftime('%d')), hour=int(parsed.strftime('%H')), minute=int(parsed.strftime('%M')), second=0)
-			
-			if dtObject_compare > now:
-				dtObject += relativedelta(months=+1)
-			
-		elif typeOfTime == 'complete':
-			outputFormat = '%Y-%m-%d, %H:%M'
+	elif typeOfTime == 'time':
+		outputFormat = '%A, %H:%M'
+		
+		dtObject = dt.datetime(now.year, now.month, now.day, parsed['hour'], parsed['minute'])
 		
-			dtObject = dt.datetime(year=int(parsed.strftime('%Y')), month=int(parsed.strftime('%m')), day=int(parsed.strftime('%d')), hour=int(parsed.strftime('%H')), minute=int(parsed.strftime('%M')), second=0)
+		if future and timezone_pytz.localize(dtObject) <= now:
+			dtObject += dt.timedelta(days=1)
 		
-		dtObject = timezone_pytz.localize(dtObject) # yeah, we can't just write tzinfo=timezone_pytz at object creation. don't ask me why
-		return(dtObject, outputFormat)
+	elif typeOfTime == 'day':
+		outputFormat = '%B %d, %H:%M'
+		
+		dtObject = nextDayOfMonth(now, parsed['day'], parsed['hour'], parsed['minute'], timezone_pytz)
+		
+	elif typeOfTime == 'complete':
+		outputFormat = '%Y-%m-%d, %H:%M'
+		
+		dtObject = dt.datetime(parsed['year'], parsed['month'], parsed['day'], parsed['hour'], parsed['minute'])
+	
+	dtObject = timezone_pytz.localize(dtObject) # yeah, we can't just write tzinfo=timezone_pytz at object creation. don't ask me why
+	return(dtObject, outputFormat)
+
+
+def nextDayOfMonth(now, day, hour, minute, timezone):
+	"""
+	Returns the next time (naive datetime) at hour:minute on the day-th of a month, after now (aware datetime) in a pytz timezone: this month if it is still
+	to come, else the next month having a day-th (the 31st of January is followed by the 31st of March).
+	"""
+	year, month = now.year, now.month
+	while True:
+		try:
+			dtObject = dt.datetime(year, month, day, hour, minute)
+		except ValueError: # no such day this month
+			pass
+		else:
+			if timezone.localize(dtObject) > now:
+				return dtObject
+		year, month = (year+1, 1) if month == 12 else (year, month+1)
 
 
 def weekdayName_to_weekdayNumber(name):
@@ -335,99 +1247,230 @@ def weekdayName_to_weekdayNumber(name):
 def parse_input_time(input):
 	"""
 	Parse the input and divides it into groups of exploitable data.
+	An empty input gives an empty place (the saved place of the user, see locate()).
 	"""
-	re_simple = re.match(r"^([\w\s'’`-]+\s?(?:\([A-Za-z]{2}\))?)$", input)
+	tokens = tokenize(input)
+	if not strip(tokens):
+		return {'type': 'simple', 'source': ['', None]}
+	return {'type': 'simple', 'source': parse_place_tokens(tokens)}
+		
+
+def parse_input_conv(input):
+	"""
+	Parse the input and divides it into groups of exploitable data.
+	The time is what comes before the first "at" (or "in"), the source what comes before the first "to" (or "into") after it.
+	A time ending with a range of hours, like "9-17" or "Monday, 9am-5pm", optionally followed by a step ("every 30 min"), asks for a timetable.
+	"""
+	time, places = splitAtKeyword(tokenize(input), ('at', 'in'))
+	source, targets = splitAtKeyword(places, ('to', 'into'))
+	
+	try:
+		time, step = splitAtKeyword(time, ('every',))
+	except ValueError:
+		step = None
 	
 	data = {}
-		
-	if re_simple:
-		data['type'] = 'simple'
-		cc_source = separateCountryCodes(re_simple.groups()[0])
-		if cc_source:
-			data['source'] = [cc_source[0], cc_source[1]]
-		else:
-			data['source'] = [re_simple.groups()[0], None]
-			
-		return data
-		
-	else:
+	data['type'] = 'conversion'
+	data['time'] = parse_time_tokens(time)
+	data['source'] = parse_place_tokens(source)
+	
+	start, dash, until = data['time'].rpartition('-')
+	if start.strip() and re.fullmatch(r"\d{1,2}(?::\d{1,2})?\s*(?:am|pm)?", until.strip(), re.IGNORECASE): # the end is a time of the day
+		data['type'] = 'timetable'
+		data['time'], data['until'] = start.strip(), until.strip()
+		data['step'] = parse_step_tokens(step) if step is not None else 3600
+	elif step is not None:
 		raise ValueError
-		
+	data['targets'] = [parse_place_tokens(place) for place in splitAtCommas(targets) if strip(place)] # a trailing comma is forgiven
+	
+	if not data['targets']:
+		raise ValueError
+	
+	return data
 
-def parse_input_conv(input):
+
+def parse_input_remind(input):
 	"""
 	Parse the input and divides it into groups of exploitable data.
+	The text of the reminder is what comes after the first "to" (quotes around it are removed), the time what comes before "at" (or
+	"in") before it, and the place what comes between them (the saved place if there is no "at").
 	"""
-	re_conversion = re.match(r"^([A-Za-z0-9,:/\-\s]+) (?:at|in) ([\w\s'’`-]+\s?(?:\([A-Za-z]{2}\))?) (?:to|into) ((?:[\w\s'’`-]+\s?(?:\([A-Za-z]{2}\))?,?\s?)+)$", input)
+	tokens, text = splitAtKeyword(tokenize(input), ('to',))
+	
+	try:
+		time, source = splitAtKeyword(tokens, ('at', 'in'))
+	except ValueError: # no place
+		time, source = tokens, None
+	
+	text = ''.join(strip(text))
+	if len(text) >= 2 and (text[0], text[-1]) in (('"', '"'), ('“', '”')):
+		text = text[1:-1].strip()
+	if not text or len(text) > reminder_limit:
+		raise ValueError
 	
 	data = {}
+	data['type'] = 'reminder'
+	data['time'] = parse_time_tokens(time)
+	data['source'] = parse_place_tokens(source) if source is not None else ['', None]
+	data['text'] = text
+	return data
+
+
+def parse_step_tokens(tokens):
+	"""
+	Returns the step (seconds) written by tokens, like "1h", "2 hours", "30 min", "1h30" or "hour". Raises ValueError if it is none.
+	"""
+	step = re.fullmatch(r"(?:(\d+)\s*(?:h|hours?)(?:\s*(\d+)\s*(?:m|min|mins|minutes?)?)?|(\d+)\s*(?:m|min|mins|minutes?)|(hour))", ''.join(strip(tokens)), re.IGNORECASE)
+	if not step:
+		raise ValueError
 	
-	if re_conversion:
-		data['type'] = 'conversion'
-		cc_source = separateCountryCodes(re_conversion.groups()[1])
-		if cc_source:
-			data['source'] = [cc_source[0], cc_source[1]]
-		else:
-			data['source'] = [re_conversion.groups()[1], None]
-	
-		targets_raw = re_conversion.groups()[2]
-		targets = targets_raw.split(',')
-		data['targets'] = []
-		data['time'] = re_conversion.groups()[0]
-		
-		for place in targets:
-			place = place.strip()
-			cc_target = separateCountryCodes(place)
-			if cc_target:
-				data['targets'].append([cc_target[0], cc_target[1]])
-			else:
-				data['targets'].append([place, None])
-					
-		return data
-		
-	else:
+	hours, minutes, onlyMinutes, hour = step.groups()
+	seconds = 3600 if hour else int(hours or 0)*3600+int(minutes or onlyMinutes or 0)*60
+	if not seconds:
 		raise ValueError
+	return seconds
+
+
+def timetableInstants(start, until, step, timezone):
+	"""
+	Returns the instants (timestamps) of a timetable: from start (a datetime of timezone) to the time of the day until (like "17" or "5pm"),
+	every step seconds. until is on the day of start, or on the next one if it is not later. Steps are real durations: across a change of
+	time, the local times of the source skip or repeat an hour.
+	Raises ValueError if until is not a time of the day, IndexError if there are more than timetable_rows rows.
+	"""
+	parsed = time_parser.parse(until)
+	if parsed['type'] != 'time':
+		raise ValueError
+	
+	end = dt.datetime.combine(start.date(), dt.time(parsed['hour'], parsed['minute']))
+	if timezone.localize(end) <= start:
+		end += dt.timedelta(days=1)
+	
+	first = int(start.timestamp())
+	last = int(timezone.localize(end).timestamp())
+	if (last-first)//step >= timetable_rows:
+		raise IndexError
+	
+	return list(range(first, last+1, step))
+
+
+def utcOffsets(timezone, instants):
+	"""
+	Returns the UTC offsets (seconds) of a pytz timezone at sorted instants (timestamps), walking its transitions once for all of them.
+	"""
+	starts, offsets, names = timezones.transitions(timezone)
+	i = max(bisect.bisect_right(starts, instants[0])-1, 0)
+	
+	result = []
+	for instant in instants:
+		while i+1 < len(starts) and starts[i+1] <= instant:
+			i += 1
+		result.append(offsets[i])
+	return result
+
+
+def timetable(instants, places):
+	"""
+	Returns the lines of a grid of the local times of places (the source first) at instants, in a code block.
+	A time on another day than the first one of the source is followed by the difference (+1, -1...).
+	"""
+	columns = []
+	for place in places:
+		days, minutes = zip(*(divmod(instant+offset, 86400) for instant, offset in zip(instants, utcOffsets(place.timezone_pytz, instants))))
+		columns.append((place.name, days, ['{:02d}:{:02d}'.format(*divmod(minute//60, 60)) for minute in minutes]))
+	
+	first = columns[0][1][0]
+	cells = []
+	for name, days, times in columns:
+		texts = [time+('{:+d}'.format(day-first) if day != first else '') for time, day in zip(times, days)]
+		width = max(len(name), max(len(text) for text in texts))
+		cells.append([name.ljust(width)]+[text.ljust(width) for text in texts])
+	
+	return ['```']+['  '.join(row).rstrip() for row in zip(*cells)]+['```']
+
+
+def sunPhase(elevation, rising):
+	"""
+	Returns the phase of the sun ('day', 'sunrise_civil', 'sunset_nautical', 'night'...) from its elevation and its direction.
+	"""
+	if elevation > 2:
+		return 'day'
+	elif elevation > -6:
+		return 'sunrise_civil' if rising else 'sunset_civil'
+	elif elevation > -12:
+		return 'sunrise_nautical' if rising else 'sunset_nautical'
+	else:
+		return 'night'
+
+
+def sunPhases(day, latitude, longitude, timezone):
+	"""
+	Calculates the phases of the sun during a local day, as two lists: the instants (timestamps) at which they start, sorted, and the phases.
+	The first phase starts at local midnight. The sun is rising between solar midnight and solar noon.
+	The elevation is sampled every phase_step seconds, and each change of phase found is located to the second by bisection.
+	"""
+	import astral
+	
+	a = astral.Astral()
+	tz = timezones.get(timezone)
+	start = tz.localize(dt.datetime.combine(day, dt.time())).timestamp()
+	end = tz.localize(dt.datetime.combine(day+dt.timedelta(days=1), dt.time())).timestamp()
+	noon = a.solar_noon_utc(day, longitude).timestamp()
+	
+	def phase(instant):
+		rising = (instant-noon) % 86400 >= 43200
+		return sunPhase(a.solar_elevation(dt.datetime.fromtimestamp(instant, tz), latitude, longitude), rising)
+	
+	instants = [start]
+	phases = [phase(start)]
+	
+	before = start
+	while before < end:
+		after = min(before+phase_step, end)
+		current = phase(after)
+		
+		if current != phases[-1]:
+			low, high = before, after
+			while high-low > 1:
+				middle = (low+high)//2
+				if phase(middle) == phases[-1]:
+					low = middle
+				else:
+					high = middle
+			instants.append(high)
+			phases.append(current)
+		
+		before = after
+	
+	return instants, phases
 
 
 def colorTime(date, latitude, longitude, altitude, timezone):
 	"""
 	Returns a color for the "box lining", depending of the state of the sun (day, sunrise, sunset, night)
 	Returns also the proper emoji to illustrate time.
+	The phases of the day are calculated once per place and local date (see sunPhases()), then memoized in phase_cache.
 	"""
 	colors = {
-	'day': 'ffca28',
-	'sunset_civil': 'f85908',
-	'sunset_nautical': '2131a6',
-	'sunrise_civil': 'fd88c2',
-	'sunrise_nautical': '2131a6',
-	'night': '070555'
+	'day': ('ffca28', ':sun_with_face:'),
+	'sunset_civil': ('f85908', ':sun_with_face: :arrow_down:'),
+	'sunset_nautical': ('2131a6', ':last_quarter_moon_with_face: :arrow_up:'),
+	'sunrise_civil': ('fd88c2', ':sun_with_face: :arrow_up:'),
+	'sunrise_nautical': ('2131a6', ':last_quarter_moon_with_face: :arrow_down:'),
+	'night': ('070555', ':last_quarter_moon_with_face:')
 	}
 	
-	l = astral.Location(('Name is not necessary here', 'XX', float(latitude), float(longitude), timezone, int(altitude)))
-	angle = l.solar_elevation(date)
-	solarMidnight = l.solar_midnight(date)
+	key = (latitude, longitude, timezone, date.date())
+	table = phase_cache.get(key)
 	
-	# Solar midnight can be (and usually is) after midnight. We need to set it for "the next night", as it will be the one from the previous night.
-	noonToday = date.replace(hour=12, minute=0, second=0)
-	if(date > noonToday):
-		solarMidnight += relativedelta(days=+1)
+	if table is None:
+		table = sunPhases(date.date(), latitude, longitude, timezone)
+		phase_cache.put(key, table)
 	
-	if angle > 2:
-		return(colors['day'], ':sun_with_face:') # day
-	elif angle > -6:
-		if date < solarMidnight:
-			return(colors['sunset_civil'], ':sun_with_face: :arrow_down:') # civil sunset
-		else:
-			return(colors['sunrise_civil'], ':sun_with_face: :arrow_up:') # civil sunrise
-	elif angle > -12:
-		if date < solarMidnight:
-			return(colors['sunset_nautical'], ':last_quarter_moon_with_face: :arrow_up:') # nautical sunset
-		else:
-			return(colors['sunrise_nautical'], ':last_quarter_moon_with_face: :arrow_down:') # nautical sunrise
-	else:
-		return(colors['night'], ':last_quarter_moon_with_face:') # night
+	instants, phases = table
+	return colors[phases[max(bisect.bisect_right(instants, date.timestamp())-1, 0)]]
+
 
-	
 
 #--------------------------------------------------#
 # a!sun/sundetails functions                       #
@@ -437,45 +1480,31 @@ def parse_input_sun(input):
 	"""
 	Parse the input and divides it into groups of exploitable data.
 	"""
-	# Simple case
-	re_now = re.match(r"^([\w\s'’`-]+\s?(?:\([A-Za-z]{2}\))?)$", input)
-	
-	# We also provide a date
-	re_other = re.match(r"^([A-Za-z0-9,:/\-\s]+) (?:at|in) ([\w\s'’`-]+\s?(?:\([A-Za-z]{2}\))?)$", input)
+	tokens = tokenize(input)
 	
-	data = {}
-		
-	if re_other:
-		data['type'] = 'other'
-		data['time'] = re_other.groups()[0]
-		cc_source = separateCountryCodes(re_other.groups()[1])
-		
-		if cc_source:
-			data['source'] = [cc_source[0], cc_source[1]]
-		else:
-			data['source'] = [re_other.groups()[1], None]
-			
-		return data
+	# We also provide a date (tried first, as a place could also be written like a time)
+	try:
+		time, source = splitAtKeyword(tokens, ('at', 'in'))
+		return {'type': 'other', 'time': parse_time_tokens(time), 'source': parse_place_tokens(source)}
+	except ValueError:
+		pass
 	
-	elif re_now: # re_now after re_other, otherwises it always matches re_now if re_other matches. I am too lazy to correct that
-		data['type'] = 'now'
-		cc_source = separateCountryCodes(re_now.groups()[0])
-		if cc_source:
-			data['source'] = [cc_source[0], cc_source[1]]
-		else:
-			data['source'] = [re_now.groups()[0], None]
-			
-		return data
-		
-	else:
-		raise ValueError
+	# Simple case (an empty input gives an empty place, see locate())
+	if not strip(tokens):
+		return {'type': 'now', 'source': ['', None]}
+	return {'type': 'now', 'source': parse_place_tokens(tokens)}
 		
 
 def sunrise_sunset(date, latitude, longitude, altitude, types):
 	"""
 	Calculates sunrise and sunsets on a location depending of a date.
 	"""
-	l = astral.Location(('NotNecessaryHere', 'XX', float(latitude), float(longitude), str(date.tzinfo), int(altitude)))
+	if solar_engine == 'numpy':
+		return sunrise_sunset_numpy(date, latitude, longitude, altitude, types)
+	
+	import astral
+	
+	l = astral.Location(('NotNecessaryHere', 'XX', latitude, longitude, str(date.tzinfo), altitude))
 	
 	sun = {}
 	
@@ -563,32 +1592,159 @@ def sunrise_sunset(date, latitude, longitude, altitude, types):
 	return sun
 
 
+def sunrise_sunset_numpy(date, latitude, longitude, altitude, types):
+	"""
+	Same as sunrise_sunset(), calculated by the NumPy engine (solar.py). Results are the same within a second.
+	"""
+	import pytz
+	import solar
+	
+	timezone = timezones.get(str(date.tzinfo))
+	events = solar.events(latitude, longitude, altitude, date.replace(tzinfo=None)) # astral also uses the local time as is
+	
+	sun = {}
+	for key, name in solarEventNames.items():
+		if key in types:
+			instant = events[name].item()
+			sun[key] = False if instant is None else pytz.utc.localize(instant).astimezone(timezone)
+	
+	if events['polar_day']:
+		sun['day'] = '24 h 00 min'
+		sun['night'] = '0 h 00 min'
+	elif events['polar_night']:
+		sun['day'] = '0 h 00 min'
+		sun['night'] = '24 h 00 min'
+	else:
+		delta_day = events['sunset'].item()-events['sunrise'].item()
+		sun['day'] = strfdelta(delta_day, '{H} h {M} min')
+		sun['night'] = strfdelta(dt.timedelta(hours=24)-delta_day, '{H} h {M} min')
+	
+	return sun
+
+
+def sunTable(dates, lines=None):
+	"""
+	Calculates the sun events of many cities (row ids in the database, all of them by default) on many dates at once, with the NumPy engine.
+	Returns the dictionary of arrays of solar.events(), of shape (number of cities, number of dates).
+	"""
+	import numpy
+	import solar
+	
+	cities = snapshot().cities
+	latitudes = numpy.frombuffer(cities.latitude, dtype='float64')
+	longitudes = numpy.frombuffer(cities.longitude, dtype='float64')
+	altitudes = numpy.frombuffer(cities.altitude, dtype='int16')
+	
+	if lines is not None:
+		latitudes, longitudes, altitudes = latitudes[lines], longitudes[lines], altitudes[lines]
+	
+	dates = numpy.asarray(dates, dtype='datetime64[D]')[numpy.newaxis, :]
+	return solar.events(latitudes[:, numpy.newaxis], longitudes[:, numpy.newaxis], altitudes[:, numpy.newaxis], dates)
+
+
+def sunEvents(city, date, types):
+	"""
+	sunrise_sunset() for a City, memoized in sun_cache by (position of the city, local date, types).
+	The local date is part of the key, so a new day starts at local midnight; entries of past days are evicted as they stop being used.
+	The position is used rather than the row of the city, which changes when the database is reloaded (see reload()).
+	The returned dictionary is shared and must not be modified.
+	"""
+	key = (city.latitude, city.longitude, city.altitude, city.timezone_str, date.date(), types)
+	sun = sun_cache.get(key)
+	
+	if sun is None:
+		sun = sunrise_sunset(date, city.latitude, city.longitude, city.altitude, types)
+		sun_cache.put(key, sun)
+	
+	return sun
+
+
+
+#--------------------------------------------------#
+# a!dst functions                                  #
+#--------------------------------------------------#
+
+def clockChanges(timezone, instant):
+	"""
+	Returns the last change of time of a pytz timezone at instant (timestamp) or before, and the next one after, found by bisection
+	in its transitions(). Each is (instant, offset before, offset after, abbreviation after), or None if there is none.
+	"""
+	starts, offsets, names = timezones.transitions(timezone)
+	i = bisect.bisect_right(starts, instant) # the offset at instant is offsets[i-1]
+	
+	previous = (starts[i-1], offsets[i-2], offsets[i-1], names[i-1]) if i >= 2 else None
+	following = (starts[i], offsets[i-1], offsets[i], names[i]) if i < len(starts) else None
+	return previous, following
+
+
+def formatOffset(offset):
+	"""
+	Returns an UTC offset (seconds) written like UTC+05:30.
+	"""
+	return 'UTC{}{:02d}:{:02d}'.format('-' if offset < 0 else '+', *divmod(abs(offset)//60, 60))
+
+
+def describeChange(change, future):
+	"""
+	Returns the sentence describing a change of time given by clockChanges().
+	"""
+	instant, before, after, name = change
+	local = dt.datetime(1970, 1, 1)+dt.timedelta(seconds=instant+before)
+	direction = 'forward' if after > before else 'back'
+	verb = 'go' if future else 'went'
+	return '{}, clocks {} {} to {} ({}, {})'.format(local.strftime('%A %Y-%m-%d at %H:%M'), verb, direction, (local+dt.timedelta(seconds=after-before)).strftime('%H:%M'), formatOffset(after), name)
+
+
 
 #--------------------------------------------------#
 # Command handlers                                 #
 #--------------------------------------------------#
 
-def command_time(input):
+@metrics.instrumented('time')
+def command_time(input, saved=None):
 	"""
 	"time" command handler
 	example: a!time Aix-en-Provence (FR)
+	saved is the place saved by the user, if any (see locate()).
+	The answer cannot change before the next minute, so it is memoized in time_cache until then (by database and inputKey(), so that
+	answers of a database are not given once another one is loaded). The returned Output is shared and must not be modified.
+	"""
+	key = (snapshot(), inputKey(input, saved))
+	minute = time_cache.minute()
+	output = time_cache.get(key, minute)
+	
+	if output is None:
+		output = timeOutput(input, saved)
+		time_cache.put(key, output, minute)
+	
+	return output
+
+
+def timeOutput(input, saved=None):
+	"""
+	Computes the answer of command_time().
 	"""
 	output = Output()
 	output.subtype = 'simple'
 	
 	# trying to understand the command entered
 	try:
-		parsed = parse_input_time(input)
+		with metrics.stage('time', 'parse_input'):
+			parsed = parse_input_time(input)
 	except ValueError: # total mess in command
 		return errorMessage('IncorrectInput')
 	
 	# trying to find source location
 	try:
-		source = parse_location(*parsed['source'])
+		with metrics.stage('time', 'parse_location'):
+			source = locate(parsed['source'], saved)
 	except ValueError: # location not found
-		return errorMessage('IncorrectPlace', place=parsed['source'][0])
-	except UnknownTimeZoneError: # location found, but incorrect timezone
+		with metrics.stage('time', 'suggest'):
+			return errorMessage('IncorrectPlace', place=parsed['source'][0], suggestions=suggestPlaces(*parsed['source']))
+	except KeyError: # location found, but incorrect timezone (pytz.UnknownTimeZoneError)
 		return errorMessage('IncorrectData')
+	except LookupError: # no place, nothing saved
+		return errorMessage('NoSavedPlace')
 	
 	# converting
 	timeAtSource = dt.datetime.now(source.timezone_pytz)
@@ -596,7 +1752,8 @@ def command_time(input):
 	if isinstance(source, City):
 		output.title = 'Current time at '+source.name+' :flag_'+source.countrycode+': :'
 		# setting a nice color depending of day/night :)
-		output.color, emoji = colorTime(timeAtSource, source.latitude, source.longitude, source.altitude, source.timezone_str)
+		with metrics.stage('time', 'color'):
+			output.color, emoji = colorTime(timeAtSource, source.latitude, source.longitude, source.altitude, source.timezone_str)
 		output.description.append(emoji+' '+timeAtSource.strftime('%A, %H:%M'))
 		
 	elif isinstance(source, Timezone):
@@ -607,10 +1764,13 @@ def command_time(input):
 	return output
 	
 
-def command_conv(input):
+@metrics.instrumented('conv')
+def command_conv(input, saved=None):
 	"""
 	"conv" command handler
 	example: a!conv 15:30 at Aix-en-Provence (FR) to Reykjavik, PST
+	example: a!conv 9-17 every 1h at Paris to Tokyo, NYC, Sydney (a timetable)
+	saved is the place saved by the user, if any: "me" as a place (see locate()).
 	"""
 	output = Output()
 	output.subtype = 'conversion'
@@ -618,73 +1778,117 @@ def command_conv(input):
 	
 	# trying to understand the command entered
 	try:
-		parsed = parse_input_conv(input)
+		with metrics.stage('conv', 'parse_input'):
+			parsed = parse_input_conv(input)
 	except ValueError: # total mess in command
 		return errorMessage('IncorrectInput')
 	
 	# trying to find source location
 	try:
-		source = parse_location(*parsed['source'])
+		with metrics.stage('conv', 'parse_location'):
+			source = locate(parsed['source'], saved)
 	except ValueError: # location not found
-		return errorMessage('IncorrectPlace', place=parsed['source'][0])
-	except UnknownTimeZoneError: # location found, but incorrect timezone
+		with metrics.stage('conv', 'suggest'):
+			return errorMessage('IncorrectPlace', place=parsed['source'][0], suggestions=suggestPlaces(*parsed['source']))
+	except KeyError: # location found, but incorrect timezone (pytz.UnknownTimeZoneError)
 		return errorMessage('IncorrectData')
 	
 	# trying to find all targets locations
 	for i, place in enumerate(parsed['targets']):
 		try:
-			parsed['targets'][i] = parse_location(*place)
+			with metrics.stage('conv', 'parse_location'):
+				parsed['targets'][i] = locate(place, saved)
 		except ValueError: # same
-			return errorMessage('IncorrectPlace', place=parsed['targets'][i][0])
+			with metrics.stage('conv', 'suggest'):
+				return errorMessage('IncorrectPlace', place=parsed['targets'][i][0], suggestions=suggestPlaces(*parsed['targets'][i]))
+		except KeyError: # same
+			return errorMessage('IncorrectData')
 	
 	# trying to parse time
 	try:
-		parsed['time'], outputFormat = parse_time(parsed['time'], source.timezone_str)
+		with metrics.stage('conv', 'parse_time'):
+			parsed['time'], outputFormat = parse_time(parsed['time'], source.timezone_str)
 	except ValueError:
 		return errorMessage('IncorrectTime')
 	
 	# here we are
 	timeAtSource = parsed['time']
 	
+	if parsed['type'] == 'timetable':
+		try:
+			with metrics.stage('conv', 'parse_time'):
+				instants = timetableInstants(timeAtSource, parsed['until'], parsed['step'], source.timezone_pytz)
+		except ValueError:
+			return errorMessage('IncorrectTime')
+		except IndexError:
+			return errorMessage('IncorrectRange')
+		
+		hours, minutes = divmod(parsed['step']//60, 60)
+		step = ('{}h{:02d}'.format(hours, minutes) if minutes else '{}h'.format(hours)) if hours else '{} min'.format(minutes)
+		ending = dt.datetime.fromtimestamp(instants[-1], source.timezone_pytz).strftime('%H:%M')
+		
+		if isinstance(source, City):
+			output.title = timeAtSource.strftime(outputFormat)+' to '+ending+' at '+source.name+' :flag_'+source.countrycode+':, every '+step+':'
+		elif isinstance(source, Timezone):
+			output.title = timeAtSource.strftime(outputFormat)+' to '+ending+' '+source.name+', every '+step+':'
+		
+		with metrics.stage('conv', 'convert'):
+			output.description = timetable(instants, [source]+parsed['targets'])
+		
+		if len('\n'.join(output.description)) > embed_limit:
+			return errorMessage('IncorrectRange')
+		return output
+	
 	if isinstance(source, City):
 		output.title = timeAtSource.strftime(outputFormat)+' at '+source.name+' :flag_'+source.countrycode+': is:'
 	elif isinstance(source, Timezone):
 		output.title = timeAtSource.strftime(outputFormat)+' '+source.name+' is:'
 	
-	for place in parsed['targets']:
-		# converting for every target
-		timeAtTarget = timeAtSource.astimezone(place.timezone_pytz)
-		
-		if isinstance(place, City):
-			output.description.append(timeAtTarget.strftime(outputFormat)+' at '+place.name+' :flag_'+place.countrycode+':')
-		elif isinstance(place, Timezone):
-			output.description.append(timeAtTarget.strftime(outputFormat)+' '+place.name)
+	with metrics.stage('conv', 'convert'):
+		for place in parsed['targets']:
+			# converting for every target
+			timeAtTarget = timeAtSource.astimezone(place.timezone_pytz)
+			
+			if isinstance(place, City):
+				output.description.append(timeAtTarget.strftime(outputFormat)+' at '+place.name+' :flag_'+place.countrycode+':')
+			elif isinstance(place, Timezone):
+				output.description.append(timeAtTarget.strftime(outputFormat)+' '+place.name)
 	
 	return output
 	
 
-def command_sun(input, detailed=False):
+@metrics.instrumented('sun')
+def command_sun(input, detailed=False, saved=None):
 	"""
 	"time" command handler
 	example: a!sun Reykjavík
+	saved is the place saved by the user, if any (see locate()).
 	"""
 	output = Output()
 	output.color = '808080'
 	
 	try:
-		parsed = parse_input_sun(input)
+		with metrics.stage('sun', 'parse_input'):
+			parsed = parse_input_sun(input)
 	except ValueError: # total mess in command
 		return errorMessage('IncorrectInput')
 		
 	try:
-		source = parse_location(*parsed['source'])
+		with metrics.stage('sun', 'parse_location'):
+			source = locate(parsed['source'], saved)
 	except ValueError: # location not found
-		return errorMessage('IncorrectPlace', place=parsed['source'][0])
+		with metrics.stage('sun', 'suggest'):
+			return errorMessage('IncorrectPlace', place=parsed['source'][0], suggestions=suggestPlaces(*parsed['source']))
+	except KeyError: # location found, but incorrect timezone (pytz.UnknownTimeZoneError)
+		return errorMessage('IncorrectData')
+	except LookupError: # no place, nothing saved
+		return errorMessage('NoSavedPlace')
 	
 	if parsed['type'] == 'other':
 		# trying to parse time
 		try:
-			timeAtSource = parse_time(parsed['time'], source.timezone_str)[0] # we don't care about outputFormat
+			with metrics.stage('sun', 'parse_time'):
+				timeAtSource = parse_time(parsed['time'], source.timezone_str)[0] # we don't care about outputFormat
 		except ValueError:
 			return errorMessage('IncorrectTime')
 	else:
@@ -694,7 +1898,8 @@ def command_sun(input, detailed=False):
 	
 	# here we are
 	if detailed:
-		sun = sunrise_sunset(timeAtSource, source.latitude, source.longitude, source.altitude, ('ra', 'rn', 'rc', 'r', 's', 'sc', 'sn', 'sa', 'sol_n', 'sol_m', 'day'))
+		with metrics.stage('sun', 'sun'):
+			sun = sunEvents(source, timeAtSource, ('ra', 'rn', 'rc', 'r', 's', 'sc', 'sn', 'sa', 'sol_n', 'sol_m', 'day'))
 		
 		output.description.append('Day length: '+sun['day'])
 		output.description.append('Night length: '+sun['night'])
@@ -718,7 +1923,8 @@ def command_sun(input, detailed=False):
 		
 		output.description.append('Information about these values can be found here: https://en.wikipedia.org/wiki/Twilight')
 	else:
-		sun = sunrise_sunset(timeAtSource, source.latitude, source.longitude, source.altitude, ('rn', 'r', 's', 'sn', 'day'))
+		with metrics.stage('sun', 'sun'):
+			sun = sunEvents(source, timeAtSource, ('rn', 'r', 's', 'sn', 'day'))
 		
 		output.description.append('Day length: '+sun['day'])
 		output.description.append('')
@@ -731,6 +1937,141 @@ def command_sun(input, detailed=False):
 	return output
 	
 
+@metrics.instrumented('dst')
+def command_dst(input, saved=None):
+	"""
+	"dst" command handler
+	example: a!dst Sydney
+	saved is the place saved by the user, if any (see locate()).
+	"""
+	output = Output()
+	output.color = '808080'
+	
+	try:
+		with metrics.stage('dst', 'parse_input'):
+			parsed = parse_input_time(input)
+	except ValueError: # total mess in command
+		return errorMessage('IncorrectInput')
+	
+	try:
+		with metrics.stage('dst', 'parse_location'):
+			source = locate(parsed['source'], saved)
+	except ValueError: # location not found
+		with metrics.stage('dst', 'suggest'):
+			return errorMessage('IncorrectPlace', place=parsed['source'][0], suggestions=suggestPlaces(*parsed['source']))
+	except KeyError: # location found, but incorrect timezone (pytz.UnknownTimeZoneError)
+		return errorMessage('IncorrectData')
+	except LookupError: # no place, nothing saved
+		return errorMessage('NoSavedPlace')
+	
+	if isinstance(source, City):
+		output.title = 'Changes of time at '+source.name+' :flag_'+source.countrycode+':'
+	elif isinstance(source, Timezone):
+		output.title = 'Changes of time in '+source.name
+	
+	with metrics.stage('dst', 'dst'):
+		now = dt.datetime.now(source.timezone_pytz)
+		previous, following = clockChanges(source.timezone_pytz, now.timestamp())
+	
+	output.description.append('Now: '+formatOffset(int(now.utcoffset().total_seconds()))+' ('+now.tzname()+')')
+	output.description.append('')
+	output.description.append('Next change: '+(describeChange(following, True) if following else 'none planned'))
+	output.description.append('Last change: '+(describeChange(previous, False) if previous else 'never'))
+	
+	return output
+
+
+@metrics.instrumented('save')
+def command_save(input, scope='user'):
+	"""
+	"save" command handler: finds the place to save (for a user, or a server if scope is 'server'), run.py stores it.
+	example: a!save Aix-en-Provence (FR)
+	"""
+	output = Output()
+	output.color = '808080'
+	
+	try:
+		with metrics.stage('save', 'parse_input'):
+			parsed = parse_input_time(input)
+	except ValueError: # total mess in command
+		return errorMessage('IncorrectInput')
+	
+	if not parsed['source'][0]:
+		return errorMessage('IncorrectInput')
+	
+	try:
+		with metrics.stage('save', 'parse_location'):
+			source = parse_location(*parsed['source'])
+	except ValueError: # location not found
+		with metrics.stage('save', 'suggest'):
+			return errorMessage('IncorrectPlace', place=parsed['source'][0], suggestions=suggestPlaces(*parsed['source']))
+	except KeyError: # location found, but incorrect timezone (pytz.UnknownTimeZoneError)
+		return errorMessage('IncorrectData')
+	
+	if isinstance(source, City):
+		output.title = 'Place saved: '+source.name+' :flag_'+source.countrycode+':'
+	elif isinstance(source, Timezone):
+		output.title = 'Place saved: timezone '+source.name
+	
+	if scope == 'server':
+		output.description.append('On this server, the commands given no place, or "me" as a place, now use it (for those who did not save a place).')
+	else:
+		output.description.append('The commands given no place, or "me" as a place, now use it. Try `a!time`!')
+	
+	output.place = source
+	return output
+
+
+@metrics.instrumented('remind')
+def command_remind(input, saved=None):
+	"""
+	"remind" command handler: finds the instant of the reminder, run.py schedules it.
+	example: a!remind 16,9am at Tokyo to "standup"
+	saved is the place saved by the user, if any (see locate()).
+	"""
+	output = Output()
+	output.color = '808080'
+	
+	try:
+		with metrics.stage('remind', 'parse_input'):
+			parsed = parse_input_remind(input)
+	except ValueError: # total mess in command
+		return errorMessage('IncorrectInput')
+	
+	try:
+		with metrics.stage('remind', 'parse_location'):
+			source = locate(parsed['source'], saved)
+	except ValueError: # location not found
+		with metrics.stage('remind', 'suggest'):
+			return errorMessage('IncorrectPlace', place=parsed['source'][0], suggestions=suggestPlaces(*parsed['source']))
+	except KeyError: # location found, but incorrect timezone (pytz.UnknownTimeZoneError)
+		return errorMessage('IncorrectData')
+	except LookupError: # no place, nothing saved
+		return errorMessage('NoSavedPlace')
+	
+	try:
+		with metrics.stage('remind', 'parse_time'):
+			when, outputFormat = parse_time(parsed['time'], source.timezone_str, future=True)
+	except ValueError:
+		return errorMessage('IncorrectTime')
+	
+	delay = when-dt.datetime.now(source.timezone_pytz)
+	if delay.total_seconds() <= 0: # a complete date in the past
+		return errorMessage('PastTime')
+	
+	if isinstance(source, City):
+		place = source.name+' time :flag_'+source.countrycode+':'
+	elif isinstance(source, Timezone):
+		place = 'timezone '+source.name
+	
+	output.title = ':alarm_clock: Reminder set'
+	output.description.append('I will remind you on '+when.strftime(outputFormat)+' ('+place+'), in '+strfdelta(delay, '{d} d {H} h {M} min' if delay.days else '{H} h {M} min')+':')
+	output.description.append(parsed['text'])
+	
+	output.reminder = (when.timestamp(), parsed['text'])
+	return output
+
+
 def command_credits(input, detailed=False):
 	"""
 	"help" command handler
@@ -747,8 +2088,13 @@ def command_credits(input, detailed=False):
 # Initializer                                      #
 #--------------------------------------------------#
 
-# Loads the files to be able to do everything.
-init()
+# The database is loaded at the first lookup (or when init() is called).
+database = Database()
+timezones = TimezoneRegistry()
+time_parser = TimeParser(acceptedFormats)
+sun_cache = LRUCache(4096)
+phase_cache = LRUCache(4096)
+time_cache = MinuteCache(1024)
 
 # For tests. Only executed if ailotime.py is directly executed.
 if __name__ == '__main__':
@@ -0,0 +1,304 @@
+#-------------------------------------------------------------------------------
+# Name:			dbfile
+# Purpose:		Binary database format of ailotime (written by util/conversion.py, memory-mapped by ailotime.py)
+#
+# Author:		Ailothaen (#3768)
+# Created:		october 2026
+#-------------------------------------------------------------------------------
+
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+"""
+Layout of the file (all integers are in the byte order of the machine that wrote it, recorded in the header):
+
+	header		magic (8 bytes), version (u32), byte order (u32, 1 = little, 2 = big), number of sections (u32), padding (u32)
+	directory	for each section: name (8 bytes, padded with \\0), offset (u64), length (u64)
+	sections	aligned on 8 bytes
+
+Sections are either fixed-width arrays (columns with one value per city, and the arrays of the fuzzy and nearest indexes,
+readable with memoryview.cast()), a JSON object, the string table (every string of the file, UTF-8, deduplicated) or a hash
+index. String columns are pairs of (start, end) offsets in the string table. A hash index is:
+
+	nslots, nentries, npostings, padding (u32 each)
+	slots		u32[nslots], entry number + 1 (0 = empty), open addressing on crc32(key) with linear probing
+	entries		u32[4*nentries], (key start, key end, first posting, number of postings)
+	postings	u32[npostings], row ids (numbers of the names for the trigrams of the fuzzy index)
+"""
+
+MAGIC = b'AILOTIME'
+VERSION = 4
+HEADER = struct.Struct('=8sIIII')
+DIRECTORY = struct.Struct('=8sQQ')
+BYTEORDERS = {'little': 1, 'big': 2}
+
+
+
+#--------------------------------------------------#
+# Classes                                          #
+#--------------------------------------------------#
+
+class FormatError(Exception):
+	"""
+	The file is not a database this version of ailotime can read.
+	"""
+	pass
+
+
+class StringTable:
+	"""
+	Every string of the file, stored once.
+	"""
+	def __init__(self):
+		self.data = bytearray()
+		self.spans = {}
+	
+	def add(self, string):
+		"""
+		Returns the (start, end) offsets of a string, adding it if needed.
+		"""
+		span = self.spans.get(string)
+		if span is None:
+			encoded = string.encode('UTF-8')
+			span = (len(self.data), len(self.data)+len(encoded))
+			self.data += encoded
+			self.spans[string] = span
+		return span
+
+
+class Writer:
+	"""
+	Builds a database file section by section.
+	"""
+	def __init__(self):
+		self.sections = []
+		self.strings = StringTable()
+	
+	def add_bytes(self, name, data):
+		self.sections.append((name, bytes(data)))
+	
+	def add_array(self, name, typecode, values):
+		self.add_bytes(name, array(typecode, values).tobytes())
+	
+	def add_json(self, name, obj):
+		self.add_bytes(name, json.dumps(obj, ensure_ascii=False).encode('UTF-8'))
+	
+	def add_coded(self, name, values):
+		"""
+		Adds a column with few distinct values: u16 codes, and the values themselves as JSON in the section name+'v'.
+		"""
+		codes = {}
+		column = array('H', (codes.setdefault(value, len(codes)) for value in values))
+		self.add_bytes(name, column.tobytes())
+		self.add_json(name+'v', list(codes))
+	
+	def add_strings(self, name, values):
+		"""
+		Adds a string column.
+		"""
+		spans = array('I')
+		for value in values:
+			spans.extend(self.strings.add(value))
+		self.add_bytes(name, spans.tobytes())
+	
+	def add_index(self, name, mapping):
+		"""
+		Adds a hash index. mapping is {key: row id or list of row ids}; tuple keys are joined with tabulations.
+		"""
+		nslots = 1
+		while nslots < 2*len(mapping):
+			nslots *= 2
+		
+		slots = array('I', bytes(4*nslots))
+		entries = array('I')
+		postings = array('I')
+		
+		for i, (key, rows) in enumerate(mapping.items()):
+			key = keyString(key)
+			if isinstance(rows, int):
+				rows = (rows,)
+			
+			entries.extend(self.strings.add(key))
+			entries.extend((len(postings), len(rows)))
+			postings.extend(rows)
+			
+			slot = zlib.crc32(key.encode('UTF-8')) & (nslots-1)
+			while slots[slot]:
+				slot = (slot+1) & (nslots-1)
+			slots[slot] = i+1
+		
+		head = array('I', (nslots, len(mapping), len(postings), 0))
+		self.add_bytes(name, head.tobytes()+slots.tobytes()+entries.tobytes()+postings.tobytes())
+	
+	def write(self, path):
+		"""
+		Writes the file. It is written aside then renamed, so processes that have the previous one mapped are not disturbed.
+		"""
+		sections = self.sections+[('strings', bytes(self.strings.data))]
+		
+		offset = align(HEADER.size+DIRECTORY.size*len(sections))
+		directory = []
+		for name, data in sections:
+			directory.append((name, offset, len(data)))
+			offset = align(offset+len(data))
+		
+		temporary = path+'.tmp'
+		with open(temporary, 'wb') as file:
+			file.write(HEADER.pack(MAGIC, VERSION, BYTEORDERS[sys.byteorder], len(sections), 0))
+			for name, offset, length in directory:
+				file.write(DIRECTORY.pack(name.encode('ascii'), offset, length))
+			for (name, data), (_, offset, _) in zip(sections, directory):
+				file.write(bytes(offset-file.tell()))
+				file.write(data)
+		
+		os.replace(temporary, path)
+
+
+class Reader:
+	"""
+	A database file, memory-mapped. Nothing is parsed besides the header; sections are views on the mapping.
+	"""
+	def __init__(self, path):
+		with open(path, 'rb') as file:
+			self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+		self.view = memoryview(self.mmap)
+		
+		if len(self.view) < HEADER.size:
+			raise FormatError('file too short')
+		magic, version, byteorder, count, _ = HEADER.unpack_from(self.view, 0)
+		if magic != MAGIC:
+			raise FormatError('not an ailotime database')
+		if version != VERSION:
+			raise FormatError('version {} (expected {})'.format(version, VERSION))
+		if byteorder != BYTEORDERS[sys.byteorder]:
+			raise FormatError('written on a machine with another byte order')
+		
+		self.sections = {}
+		for i in range(count):
+			name, offset, length = DIRECTORY.unpack_from(self.view, HEADER.size+i*DIRECTORY.size)
+			self.sections[name.rstrip(b'\0').decode('ascii')] = (offset, length)
+		
+		self.strings = self.section('strings')
+	
+	def section(self, name):
+		try:
+			offset, length = self.sections[name]
+		except KeyError:
+			raise FormatError('missing section '+name)
+		return self.view[offset:offset+length]
+	
+	def array(self, name, typecode):
+		return self.section(name).cast(typecode)
+	
+	def json(self, name):
+		return json.loads(str(self.section(name), 'UTF-8'))
+	
+	def coded(self, name):
+		return CodedColumn(self.array(name, 'H'), [sys.intern(value) for value in self.json(name+'v')])
+	
+	def column(self, name):
+		return StringColumn(self.strings, self.array(name, 'I'))
+	
+	def index(self, name, multiple):
+		return Index(self.strings, self.section(name), multiple)
+
+
+class CodedColumn:
+	"""
+	A read-only list of strings with few distinct values.
+	"""
+	__slots__ = ('codes', 'values')
+	
+	def __init__(self, codes, values):
+		self.codes = codes
+		self.values = values
+	
+	def __len__(self):
+		return len(self.codes)
+	
+	def __getitem__(self, i):
+		return self.values[self.codes[i]]
+
+
+class StringColumn:
+	"""
+	A read-only list of strings stored in the string table.
+	"""
+	__slots__ = ('strings', 'spans')
+	
+	def __init__(self, strings, spans):
+		self.strings = strings
+		self.spans = spans
+	
+	def __len__(self):
+		return len(self.spans)//2
+	
+	def __getitem__(self, i):
+		return str(self.strings[self.spans[2*i]:self.spans[2*i+1]], 'UTF-8')
+
+
+class Index:
+	"""
+	A read-only hash index, used like a dictionary (only get() is provided).
+	Returns a list of row ids if multiple is True, a single row id otherwise.
+	"""
+	__slots__ = ('strings', 'slots', 'entries', 'postings', 'mask', 'multiple')
+	
+	def __init__(self, strings, section, multiple):
+		words = section.cast('I')
+		nslots, nentries, npostings = words[0], words[1], words[2]
+		
+		self.strings = strings
+		self.slots = words[4:4+nslots]
+		self.entries = words[4+nslots:4+nslots+4*nentries]
+		self.postings = words[4+nslots+4*nentries:4+nslots+4*nentries+npostings]
+		self.mask = nslots-1
+		self.multiple = multiple
+	
+	def __len__(self):
+		return len(self.entries)//4
+	
+	def get(self, key, default=None):
+		key = keyString(key).encode('UTF-8')
+		slot = zlib.crc32(key) & self.mask
+		
+		while self.slots[slot]:
+			entry = 4*(self.slots[slot]-1)
+			if self.strings[self.entries[entry]:self.entries[entry+1]] == key:
+				first = self.entries[entry+2]
+				if self.multiple:
+					return self.postings[first:first+self.entries[entry+3]].tolist()
+				else:
+					return self.postings[first]
+			slot = (slot+1) & self.mask
+		
+		return default
+	
+	def __contains__(self, key):
+		return self.get(key) is not None
+
+
+
+#--------------------------------------------------#
+# Functions                                        #
+#--------------------------------------------------#
+
+def align(offset):
+	"""
+	Rounds an offset up to a multiple of 8.
+	"""
+	return (offset+7) & ~7
+
+
+def keyString(key):
+	"""
+	Index keys can be tuples (like (name, country code)); they are stored as a single string.
+	"""
+	if isinstance(key, tuple):
+		return '\t'.join(key)
+	return key
@@ -0,0 +1,119 @@
+#-------------------------------------------------------------------------------
+# Name:			locations
+# Purpose:		Places saved by the users and the servers of ailotime, kept in memory and written to SQLite behind
+#
+# Author:		Ailothaen (#3768)
+# Created:		october 2026
+#-------------------------------------------------------------------------------
+
+import logging
+import threading
+
+import ailotime
+from writebehind import WriteBehind
+
+"""
+A user can save a place (a!save), and so can a server (a!saveserver, used by its members who saved nothing). It is then used by the
+commands when they are given no place, or "me" as a place.
+
+- Saved places are kept as they were resolved (City or Timezone, with everything the commands need): they are never looked up again.
+- The SQLite file is read once, when the store is created. Then, reading is a dictionary lookup.
+- Writing is applied in memory at once; a background thread writes everything that changed to the file every delay seconds, in one
+  transaction (write-behind, see writebehind.py). The commands never wait for the disk. close() writes what is left.
+- If writing fails, the changes are kept and tried again later (the store stays consistent in memory meanwhile).
+"""
+
+logger = logging.getLogger('ailotime')
+
+
+
+#--------------------------------------------------#
+# Classes                                          #
+#--------------------------------------------------#
+
+class LocationStore:
+	"""
+	Places saved by users (scope 'user') and servers (scope 'server'), by their Discord id.
+	"""
+	def __init__(self, path, delay=5):
+		self.places = {} # (scope, id) -> City or Timezone
+		self.lock = threading.Lock() # changes reach places and the writer in the same order
+		self.writer = WriteBehind(path, 'CREATE TABLE IF NOT EXISTS places (scope TEXT, id TEXT, kind TEXT, name TEXT, countrycode TEXT, latitude REAL, longitude REAL, altitude INTEGER, timezone TEXT, PRIMARY KEY (scope, id))', writeRow, 'saved places', delay)
+		
+		for scope, id, *row in self.writer.connection.execute('SELECT scope, id, kind, name, countrycode, latitude, longitude, altitude, timezone FROM places'):
+			try:
+				self.places[(scope, id)] = fromRow(row)
+			except KeyError: # timezone unknown to this version of pytz
+				logger.warning('Saved place of %s %s ignored, unknown timezone: %s', scope, id, row[-1])
+		
+		self.writer.start()
+	
+	def __len__(self):
+		return len(self.places)
+	
+	def get(self, user, server=None):
+		"""
+		Returns the place saved by a user, or else by their server (None if they are in none), None if there is neither.
+		"""
+		place = self.places.get(('user', user))
+		if place is None and server is not None:
+			place = self.places.get(('server', server))
+		return place
+	
+	def save(self, scope, id, place):
+		with self.lock:
+			self.places[(scope, id)] = place
+			self.writer.set((scope, id), place)
+	
+	def forget(self, scope, id):
+		"""
+		Forgets a saved place. Returns whether there was one.
+		"""
+		with self.lock:
+			if self.places.pop((scope, id), None) is None:
+				return False
+			self.writer.set((scope, id), None)
+			return True
+	
+	def flush(self):
+		"""
+		Writes the changes to the file now.
+		"""
+		self.writer.flush()
+	
+	def close(self):
+		self.writer.close()
+
+
+
+#--------------------------------------------------#
+# Functions                                        #
+#--------------------------------------------------#
+
+def writeRow(connection, key, place):
+	"""
+	Writes the place saved under key (scope, id) to the file, or deletes it if place is None (see WriteBehind).
+	"""
+	if place is None:
+		connection.execute('DELETE FROM places WHERE scope = ? AND id = ?', key)
+	else:
+		connection.execute('INSERT OR REPLACE INTO places VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', key+toRow(place))
+
+
+def toRow(place):
+	"""
+	Returns the columns (kind to timezone) of a City or a Timezone.
+	"""
+	if isinstance(place, ailotime.City):
+		return ('city', place.name, place.countrycode, place.latitude, place.longitude, place.altitude, place.timezone_str)
+	return ('timezone', place.name, None, None, None, None, place.timezone_str)
+
+
+def fromRow(row):
+	"""
+	Returns the City or the Timezone of columns written by toRow(). Raises KeyError (pytz.UnknownTimeZoneError) if the timezone is unknown.
+	"""
+	kind, name, countrycode, latitude, longitude, altitude, timezone = row
+	if kind == 'city':
+		return ailotime.City(name=name, countrycode=countrycode, latitude=latitude, longitude=longitude, altitude=altitude, timezone=timezone)
+	return ailotime.Timezone(name=name, timezone=timezone)
@@ -0,0 +1,312 @@
+#-------------------------------------------------------------------------------
+# Name:			metrics
+# Purpose:		Latency histograms and counters of the commands of ailotime, exported in the Prometheus text format
+#
+# Author:		Ailothaen (#3768)
+# Created:		october 2026
+#-------------------------------------------------------------------------------
+
+import bisect
+import functools
+import logging
+import threading
+import time
+
+"""
+Disabled by default. When disabled, stage() returns a shared object doing nothing, and instrumented() calls the handler directly:
+the cost is one function call per stage.
+
+Once enable() is called:
+- with stage(command, name): records the time taken by a stage of a command in a histogram
+- instrumented(command) also records the time of the whole command (stage "total") and counts its outcomes: "ok", or the type of
+  error of the Output (IncorrectPlace, IncorrectTime...), or the name of the exception raised. The command is kept as the attribute
+  "command" of the handler; count() counts other outcomes, like "coalesced" for the commands answered by another one (see pool.py)
+- commands run by pool.py have their outcomes counted by the pool instead (see defer()), with "Busy" and "Timeout" for those it
+  answers itself; the statistics of the pool (or of anything else given to watch()) are exported with the rest
+- prometheus() returns everything in the Prometheus text format; serve() exposes it on http://host:port/metrics, log_every() logs a
+  summary periodically
+
+Worker processes have their own registry: drain() takes what they recorded, to be merged into the registry of the main process.
+"""
+
+# upper bounds of the buckets of the histograms, in seconds
+buckets = (0.00001, 0.00003, 0.0001, 0.0003, 0.001, 0.003, 0.01, 0.03, 0.1, 0.3, 1.0, 3.0, 10.0)
+
+logger = logging.getLogger('ailotime')
+enabled = False
+deferred = threading.local() # whether the outcomes of the instrumented handlers of each thread are counted by their caller (see defer())
+sources = {} # name -> function returning (name, type ('counter' or 'gauge'), value, help) of each value to export (see watch())
+
+
+
+#--------------------------------------------------#
+# Classes                                          #
+#--------------------------------------------------#
+
+class Registry:
+	"""
+	The histograms (by command and stage) and counters (by command and outcome).
+	A histogram is [count per bucket (the last one beyond every bound), sum of the durations].
+	"""
+	def __init__(self):
+		self.histograms = {}
+		self.counters = {}
+		self.lock = threading.Lock()
+	
+	def observe(self, command, stage, duration):
+		with self.lock:
+			histogram = self.histograms.get((command, stage))
+			if histogram is None:
+				histogram = self.histograms[(command, stage)] = [[0]*(len(buckets)+1), 0.0]
+			histogram[0][bisect.bisect_left(buckets, duration)] += 1
+			histogram[1] += duration
+	
+	def count(self, command, outcome, value=1):
+		with self.lock:
+			self.counters[(command, outcome)] = self.counters.get((command, outcome), 0)+value
+	
+	def drain(self):
+		"""
+		Returns what has been recorded (histograms, counters), and forgets it.
+		"""
+		with self.lock:
+			data = (self.histograms, self.counters)
+			self.histograms, self.counters = {}, {}
+		return data
+	
+	def merge(self, data):
+		"""
+		Adds what drain() returned (in another process) to this registry.
+		"""
+		histograms, counters = data
+		with self.lock:
+			for key, (counts, total) in histograms.items():
+				histogram = self.histograms.setdefault(key, [[0]*(len(buckets)+1), 0.0])
+				histogram[0] = [a+b for a, b in zip(histogram[0], counts)]
+				histogram[1] += total
+			for key, value in counters.items():
+				self.counters[key] = self.counters.get(key, 0)+value
+	
+	def snapshot(self):
+		with self.lock:
+			return {key: (list(counts), total) for key, (counts, total) in self.histograms.items()}, dict(self.counters)
+
+
+class Stage:
+	"""
+	Context manager recording the duration of a stage.
+	"""
+	__slots__ = ('command', 'name', 'start')
+	
+	def __init__(self, command, name):
+		self.command = command
+		self.name = name
+	
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+	
+	def __exit__(self, *exception):
+		registry.observe(self.command, self.name, time.perf_counter()-self.start)
+		return False
+
+
+class NoStage:
+	"""
+	Context manager doing nothing, used while the metrics are disabled.
+	"""
+	__slots__ = ()
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, *exception):
+		return False
+
+
+
+#--------------------------------------------------#
+# Functions                                        #
+#--------------------------------------------------#
+
+def enable():
+	global enabled
+	enabled = True
+
+
+def disable():
+	global enabled
+	enabled = False
+
+
+def stage(command, name):
+	"""
+	Returns a context manager recording the duration of a stage of a command (doing nothing while the metrics are disabled).
+	"""
+	if enabled:
+		return Stage(command, name)
+	return nothing
+
+
+def instrumented(command):
+	"""
+	Decorator of a command handler returning an Output: records its total duration and counts its outcomes.
+	"""
+	def decorator(function):
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			if not enabled:
+				return function(*args, **kwargs)
+			
+			start = time.perf_counter()
+			try:
+				output = function(*args, **kwargs)
+			except Exception as e:
+				if not getattr(deferred, 'active', False):
+					registry.count(command, type(e).__name__)
+				raise
+			finally:
+				registry.observe(command, 'total', time.perf_counter()-start)
+			
+			if not getattr(deferred, 'active', False):
+				registry.count(command, outcome(output))
+			return output
+		wrapper.command = command
+		return wrapper
+	return decorator
+
+
+def outcome(output):
+	"""
+	Returns the outcome of a command that returned output: "ok", or the type of error.
+	"""
+	return 'ok' if output.success else (output.subtype or 'error')
+
+
+def count(command, outcome):
+	"""
+	Counts an outcome of a command that was not computed by its instrumented handler (like "coalesced", see pool.py).
+	"""
+	if enabled:
+		registry.count(command, outcome)
+
+
+def defer(active):
+	"""
+	Makes the instrumented handlers called by this thread leave the counting of their outcomes to their caller, or not.
+	pool.py counts them itself, so that a command answered with a timeout is not counted as "ok" when its worker ends it.
+	"""
+	deferred.active = active
+
+
+def watch(name, function):
+	"""
+	Exports the values returned by function (see sources) with the metrics, replacing those watched under the same name.
+	"""
+	sources[name] = function
+
+
+def watched():
+	return [value for name, function in sorted(sources.items()) for value in function()]
+
+
+def drain():
+	return registry.drain()
+
+
+def merge(data):
+	registry.merge(data)
+
+
+def labels(**values):
+	return ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in values.items())
+
+
+def prometheus():
+	"""
+	Returns the histograms and counters in the Prometheus text format.
+	"""
+	histograms, counters = registry.snapshot()
+	lines = []
+	
+	lines.append('# HELP ailotime_stage_seconds Time taken by each stage of the commands.')
+	lines.append('# TYPE ailotime_stage_seconds histogram')
+	for (command, name), (counts, total) in sorted(histograms.items()):
+		cumulated = 0
+		for bound, count in zip(buckets+('+Inf',), counts):
+			cumulated += count
+			lines.append('ailotime_stage_seconds_bucket{{{}}} {}'.format(labels(command=command, stage=name, le=bound), cumulated))
+		lines.append('ailotime_stage_seconds_sum{{{}}} {}'.format(labels(command=command, stage=name), total))
+		lines.append('ailotime_stage_seconds_count{{{}}} {}'.format(labels(command=command, stage=name), cumulated))
+	
+	lines.append('# HELP ailotime_commands_total Commands handled, by outcome (ok, type of error or exception).')
+	lines.append('# TYPE ailotime_commands_total counter')
+	for (command, outcome), value in sorted(counters.items()):
+		lines.append('ailotime_commands_total{{{}}} {}'.format(labels(command=command, outcome=outcome), value))
+	
+	for name, type, value, help in watched():
+		name = 'ailotime_'+name+('_total' if type == 'counter' else '')
+		lines.append('# HELP {} {}'.format(name, help))
+		lines.append('# TYPE {} {}'.format(name, type))
+		lines.append('{} {}'.format(name, value))
+	
+	return '\n'.join(lines)+'\n'
+
+
+def summary():
+	"""
+	Returns a one-line summary: count and average of each stage, the outcomes of each command, and the values watched.
+	"""
+	histograms, counters = registry.snapshot()
+	stages = ['{}.{} {}x {:.2f} ms'.format(command, name, sum(counts), total/sum(counts)*1000) for (command, name), (counts, total) in sorted(histograms.items()) if sum(counts)]
+	outcomes = ['{}.{} {}'.format(command, outcome, value) for (command, outcome), value in sorted(counters.items())]
+	values = ['{} {:.6g}'.format(name, value) for name, type, value, help in watched()]
+	return 'metrics: '+', '.join(stages)+' | '+', '.join(outcomes)+' | '+', '.join(values)
+
+
+def serve(port, host='127.0.0.1'):
+	"""
+	Serves prometheus() on http://host:port/metrics, from a background thread. Returns the server.
+	(http.server is imported here: importing it costs more than the rest of ailotime, and only the bot serves the metrics.)
+	"""
+	import http.server
+	
+	class Handler(http.server.BaseHTTPRequestHandler):
+		"""
+		Answers GET /metrics with prometheus().
+		"""
+		def do_GET(self):
+			if self.path != '/metrics':
+				self.send_error(404)
+				return
+			
+			body = prometheus().encode('UTF-8')
+			self.send_response(200)
+			self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+			self.send_header('Content-Length', str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+		
+		def log_message(self, format, *args):
+			pass # scrapes are not worth a log line
+	
+	server = http.server.HTTPServer((host, port), Handler)
+	threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+	return server
+
+
+def log_every(seconds):
+	"""
+	Logs summary() every few seconds, from a background thread.
+	"""
+	def loop():
+		while True:
+			time.sleep(seconds)
+			logger.info(summary())
+	
+	threading.Thread(target=loop, name='metrics-log', daemon=True).start()
+
+
+
+registry = Registry()
+nothing = NoStage()
@@ -0,0 +1,248 @@
+#-------------------------------------------------------------------------------
+# Name:			pool
+# Purpose:		Runs the command handlers of ailotime in a bounded pool of threads or processes, off the event loop
+#
+# Author:		Ailothaen (#3768)
+# Created:		october 2026
+#-------------------------------------------------------------------------------
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+
+import ailotime
+import metrics
+
+"""
+The handlers of run.py are coroutines: while one of them computes, the bot does not answer Discord (not even the heartbeat).
+CommandPool runs the handlers of ailotime.py in worker threads or processes instead, and the coroutine waits for the answer.
+
+- Bounded: at most workers+queue commands are accepted at once (running or waiting for a worker). Beyond that, commands are refused
+  right away with a "busy" message, rather than making everyone wait longer.
+- Timeout: a command that takes more than timeout seconds is answered with a "timeout" message. It cannot be interrupted, so it
+  still counts as accepted until it actually ends.
+- Processes: each worker process loads the database once, when it starts (ailotime.init()). If the metrics are enabled when the pool
+  is created, they are enabled in the workers too, and what they record is sent back with each answer (see metrics.py).
+- Single flight: commands run with the same key (like ailotime.inputKey()) while one of them is in flight share its answer instead of
+  being computed again (a message crossposted, a raid repeating a command...). They are counted as "coalesced", in stats() and as an
+  outcome of the command in the metrics. They take no room in the pool. The answer (an Output) is shared: it must not be modified.
+- Metrics: the outcome of each command is counted by compute() rather than by the instrumented handler (see metrics.defer()): the
+  one the user got, "Busy" and "Timeout" included, even when the worker ends a command after it timed out. stats() is exported with
+  the metrics (see exported()).
+- Reload: reload() loads the database again in a thread of the event loop, and swaps it in once it is ready (see ailotime.reload()).
+  Each command looks its places up in the database that was current when it started. Processes keep their database: they are
+  replaced by new ones, started with the new database, while those of the previous pool end the commands they were given.
+- stats() gives the backpressure metrics.
+"""
+
+logger = logging.getLogger('ailotime')
+
+
+
+#--------------------------------------------------#
+# Classes                                          #
+#--------------------------------------------------#
+
+class CommandPool:
+	"""
+	A bounded pool of threads (kind='thread') or processes (kind='process') running the command handlers.
+	"""
+	def __init__(self, kind='thread', workers=4, queue=32, timeout=10):
+		if kind == 'process':
+			self.executor = processes(workers, ailotime.dbDirectory)
+		elif kind == 'thread':
+			ailotime.init() # shared by the threads
+			self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+		else:
+			raise ValueError('unknown kind of pool: '+kind)
+		
+		self.kind = kind
+		self.workers = workers
+		self.capacity = workers+queue
+		self.timeout = timeout
+		self.lock = threading.Lock() # commands end in other threads
+		
+		self.accepted = 0 # running or waiting for a worker
+		self.counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'timeouts': 0, 'coalesced': 0, 'reloads': 0}
+		self.flights = {} # (function, key) -> future of the answer of the command in flight (only used by the event loop)
+		self.peak = 0
+		self.wait_total = 0.0 # seconds spent waiting for a worker, by all the commands that started
+		self.wait_max = 0.0
+		self.started = 0
+		metrics.watch('pool', self.exported)
+	
+	async def run(self, function, *args, key=None):
+		"""
+		Runs function(*args) in the pool and returns its result (an Output).
+		Returns ailotime.errorMessage('Busy') if the pool is full, ailotime.errorMessage('Timeout') if it takes too long.
+		If key is given, a command of the same function and key that is in flight answers this one too.
+		"""
+		if key is None:
+			return await self.compute(function, *args)
+		
+		flight = self.flights.get((function, key))
+		if flight is not None:
+			with self.lock:
+				self.counters['coalesced'] += 1
+			metrics.count(getattr(function, 'command', function.__name__), 'coalesced')
+		else:
+			flight = asyncio.ensure_future(self.compute(function, *args))
+			self.flights[(function, key)] = flight
+			flight.add_done_callback(lambda future: self.flights.pop((function, key), None))
+		
+		return await asyncio.shield(flight) # a waiter cancelled does not cancel the others
+	
+	async def compute(self, function, *args):
+		"""
+		Runs function(*args) in the pool (see run()).
+		"""
+		command = getattr(function, 'command', function.__name__)
+		with self.lock:
+			if self.accepted >= self.capacity:
+				self.counters['rejected'] += 1
+				logger.warning('command refused, pool full: %s', self.stats())
+				metrics.count(command, 'Busy')
+				return ailotime.errorMessage('Busy')
+			self.accepted += 1
+			self.counters['submitted'] += 1
+			self.peak = max(self.peak, self.accepted)
+		
+		future = self.executor.submit(timed, function, time.time(), self.kind == 'process' and metrics.enabled, *args)
+		future.add_done_callback(self.done)
+		
+		try:
+			output = (await asyncio.wait_for(asyncio.wrap_future(future), self.timeout))[1]
+		except asyncio.TimeoutError:
+			with self.lock:
+				self.counters['timeouts'] += 1
+			logger.warning('command timed out after %s s: %s%r', self.timeout, function.__name__, args)
+			metrics.count(command, 'Timeout')
+			return ailotime.errorMessage('Timeout')
+		except asyncio.CancelledError: # the waiter was cancelled, not the command
+			raise
+		except Exception as e:
+			metrics.count(command, type(e).__name__)
+			raise
+		
+		metrics.count(command, metrics.outcome(output))
+		return output
+	
+	def done(self, future):
+		"""
+		Called when a command ends, in whichever thread ended it.
+		"""
+		with self.lock:
+			self.accepted -= 1
+			if future.cancelled(): # timed out before a worker took it
+				pass
+			elif future.exception() is not None:
+				self.counters['failed'] += 1
+			else:
+				self.counters['completed'] += 1
+				wait, output, recorded = future.result()
+				if recorded is not None:
+					metrics.merge(recorded)
+				self.started += 1
+				self.wait_total += wait
+				self.wait_max = max(self.wait_max, wait)
+	
+	async def reload(self, directory=None):
+		"""
+		Loads the database again (see ailotime.reload()) without blocking the event loop, then makes the commands use it. Returns the
+		new Database. If it cannot be loaded, the exception is raised and the previous one is still used.
+		"""
+		database = await asyncio.get_event_loop().run_in_executor(None, ailotime.reload, directory)
+		
+		if self.kind == 'process':
+			# swapped in the event loop, like compute() submits: no command is given to the previous pool once it is shut down
+			previous, self.executor = self.executor, processes(self.workers, database.directory)
+			previous.shutdown(wait=False) # its workers end the commands they were given, then exit
+		
+		with self.lock:
+			self.counters['reloads'] += 1
+		return database
+	
+	def stats(self):
+		"""
+		Returns the backpressure metrics: commands accepted now (running or waiting), the most ever accepted at once, the capacity,
+		the counters, and the time spent waiting for a worker (average and longest, in seconds).
+		"""
+		return {
+		'kind': self.kind,
+		'accepted': self.accepted,
+		'waiting': max(self.accepted-self.workers, 0),
+		'peak': self.peak,
+		'capacity': self.capacity,
+		**self.counters,
+		'wait_average': self.wait_total/self.started if self.started else 0.0,
+		'wait_max': self.wait_max
+		}
+	
+	def exported(self):
+		"""
+		Returns stats() as values exported with the metrics (see metrics.watch()).
+		"""
+		stats = self.stats()
+		gauges = {
+		'accepted': 'Commands running or waiting for a worker',
+		'waiting': 'Commands waiting for a worker',
+		'peak': 'Most commands ever accepted at once',
+		'capacity': 'Most commands accepted at once (workers+queue)',
+		'wait_average': 'Average time spent waiting for a worker (seconds)',
+		'wait_max': 'Longest time spent waiting for a worker (seconds)'
+		}
+		counters = {
+		'submitted': 'Commands given to a worker',
+		'completed': 'Commands ended by a worker',
+		'failed': 'Commands that raised an exception in a worker',
+		'rejected': 'Commands refused because the pool was full',
+		'timeouts': 'Commands answered with a timeout message',
+		'coalesced': 'Commands answered by an identical command in flight',
+		'reloads': 'Reloads of the database'
+		}
+		values = [('pool_'+name, 'gauge', stats[name], help) for name, help in gauges.items()]
+		values += [('pool_'+name, 'counter', stats[name], help) for name, help in counters.items()]
+		return values
+	
+	def shutdown(self):
+		self.executor.shutdown(wait=False)
+
+
+
+#--------------------------------------------------#
+# Functions                                        #
+#--------------------------------------------------#
+
+def processes(workers, directory):
+	"""
+	Returns a pool of worker processes using the database of directory.
+	"""
+	return concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=(metrics.enabled, directory))
+
+
+def initWorker(metricsEnabled, directory):
+	"""
+	Prepares a worker process (forked workers already have the database if the main process loaded it).
+	"""
+	ailotime.init(directory)
+	if metricsEnabled:
+		metrics.drain() # forked workers start with a copy of what the main process recorded
+		metrics.enable()
+
+
+def timed(function, submitted, drain, *args):
+	"""
+	Runs function(*args) in a worker. Returns the time the command waited for the worker, the result, and the metrics recorded by
+	the worker if drain is True (None otherwise).
+	(Module-level, so that it can be sent to worker processes.)
+	"""
+	wait = time.time()-submitted
+	metrics.defer(True) # counted by compute()
+	try:
+		with ailotime.pin(): # even if the database is reloaded meanwhile
+			output = function(*args)
+	finally:
+		metrics.defer(False)
+	return wait, output, metrics.drain() if drain else None
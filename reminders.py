@@ -0,0 +1,145 @@
+#-------------------------------------------------------------------------------
+# Name:			reminders
+# Purpose:		Reminders of ailotime (a!remind), waiting in a heap and written to SQLite behind
+#
+# Author:		Ailothaen (#3768)
+# Created:		october 2026
+#-------------------------------------------------------------------------------
+
+import asyncio
+import heapq
+import logging
+import time
+
+from writebehind import WriteBehind
+
+"""
+A user can ask to be reminded of something at a time of a place (a!remind); ailotime.command_remind() finds the instant (UTC).
+
+- Reminders wait in a heap, earliest first. One coroutine (run()) sends those that are due, then sleeps until the next one (or until
+  a reminder earlier than the others is added): there is no task per reminder, whatever their number.
+- Due reminders are sent by bursts of burst, every interval seconds at most. After a downtime, the reminders missed meanwhile are
+  all due at once: they are sent this way rather than all together (marked as late), and so are many reminders due at the same time.
+- The SQLite file is read once, when the store is created. Changes are written to the file every delay seconds by a background
+  thread, in one transaction (write-behind, see writebehind.py). A reminder sent less than delay seconds before the bot stops
+  abruptly may be sent again at restart, rather than being lost.
+"""
+
+logger = logging.getLogger('ailotime')
+
+
+
+#--------------------------------------------------#
+# Classes                                          #
+#--------------------------------------------------#
+
+class ReminderStore:
+	"""
+	Reminders waiting to be sent: (instant (UTC timestamp), id, user id, channel id, text), kept in a heap by instant.
+	"""
+	def __init__(self, path, delay=5, burst=10, interval=1.0, limit=25):
+		self.burst = burst
+		self.interval = interval
+		self.limit = limit # most reminders waiting per user
+		self.nap = 60 # longest sleep of run() (seconds), so that a change of the clock of the system is noticed
+		
+		self.heap = [] # only used by the event loop
+		self.counts = {} # user id -> reminders waiting
+		self.wakeup = None # asyncio.Event set when a reminder is added, created by run()
+		self.writer = WriteBehind(path, 'CREATE TABLE IF NOT EXISTS reminders (id INTEGER PRIMARY KEY, instant REAL, user TEXT, channel TEXT, text TEXT)', writeRow, 'reminders', delay)
+		
+		for id, instant, user, channel, text in self.writer.connection.execute('SELECT id, instant, user, channel, text FROM reminders'):
+			self.heap.append((instant, id, user, channel, text))
+			self.counts[user] = self.counts.get(user, 0)+1
+		heapq.heapify(self.heap)
+		self.next_id = max((reminder[1] for reminder in self.heap), default=0)+1
+		
+		self.writer.start()
+	
+	def __len__(self):
+		return len(self.heap)
+	
+	def add(self, instant, user, channel, text):
+		"""
+		Adds a reminder (in the event loop). Returns its id, or None if the user has already limit reminders waiting.
+		"""
+		if self.counts.get(user, 0) >= self.limit:
+			return None
+		
+		reminder = (instant, self.next_id, user, channel, text)
+		self.next_id += 1
+		heapq.heappush(self.heap, reminder)
+		self.counts[user] = self.counts.get(user, 0)+1
+		self.writer.set(reminder[1], reminder)
+		
+		if self.wakeup is not None and self.heap[0] is reminder: # earlier than the one run() is waiting for
+			self.wakeup.set()
+		return reminder[1]
+	
+	def due(self, now, count):
+		"""
+		Removes and returns at most count reminders due at now (timestamp), earliest first.
+		"""
+		reminders = []
+		while self.heap and self.heap[0][0] <= now and len(reminders) < count:
+			reminder = heapq.heappop(self.heap)
+			reminders.append(reminder)
+			
+			user = reminder[2]
+			self.counts[user] -= 1
+			if not self.counts[user]:
+				del self.counts[user]
+		
+		for reminder in reminders:
+			self.writer.set(reminder[1], None)
+		return reminders
+	
+	async def run(self, send):
+		"""
+		Sends the reminders when they are due, forever: await send(reminder, late), late being the seconds since it was due.
+		A reminder that send() fails to send (its channel was deleted...) is dropped.
+		"""
+		self.wakeup = asyncio.Event()
+		
+		while True:
+			reminders = self.due(time.time(), self.burst)
+			for reminder in reminders:
+				try:
+					await send(reminder, time.time()-reminder[0])
+				except Exception as e:
+					logger.warning('Cannot send the reminder %s of %s, dropped: %r', reminder[1], reminder[2], e)
+			
+			if len(reminders) == self.burst: # there may be more due: they wait for the next burst
+				await asyncio.sleep(self.interval)
+				continue
+			
+			self.wakeup.clear()
+			timeout = min(self.heap[0][0]-time.time(), self.nap) if self.heap else self.nap
+			try:
+				await asyncio.wait_for(self.wakeup.wait(), max(timeout, 0))
+			except asyncio.TimeoutError:
+				pass
+	
+	def flush(self):
+		"""
+		Writes the changes to the file now.
+		"""
+		self.writer.flush()
+	
+	def close(self):
+		self.writer.close()
+
+
+
+#--------------------------------------------------#
+# Functions                                        #
+#--------------------------------------------------#
+
+def writeRow(connection, id, reminder):
+	"""
+	Writes a reminder to the file, or deletes the reminder id if reminder is None (see WriteBehind).
+	"""
+	if reminder is None:
+		connection.execute('DELETE FROM reminders WHERE id = ?', (id,))
+	else:
+		connection.execute('INSERT OR REPLACE INTO reminders VALUES (?, ?, ?, ?, ?)', (id,)+reminder[:1]+reminder[2:])
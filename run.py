@@ -10,14 +10,44 @@ import discord
 from discord.ext.commands import Bot
 from discord.ext import commands
 import asyncio
+import logging
 import platform
+import signal
 
 import ailotime
+import metrics
+from locations import LocationStore
+from pool import CommandPool
+from reminders import ReminderStore
 
 
+logger = logging.getLogger('ailotime')
 client = Bot(description="ailotime – a useful bot for timezones and daylight stuff", command_prefix="a!", pm_help=False)
 token = 'YOUR TOKEN HERE'
 
+# Commands are computed by a pool of workers, so that the bot keeps talking to Discord meanwhile (see pool.py).
+# Identical commands arriving while one of them is computed share its answer.
+pool_kind = 'thread' # or 'process', to use several CPUs (each process loads the database)
+pool_workers = 4
+pool_queue = 32 # commands waiting for a worker; more are refused until some are done
+command_timeout = 10 # seconds
+
+# Latency of each stage of the commands, and their outcomes (see metrics.py). Disabled if both are None.
+metrics_port = None # like 9101, to expose them for Prometheus on http://127.0.0.1:9101/metrics
+metrics_log_interval = None # like 300, to log a summary every 300 seconds
+
+# Places saved by the users and the servers (a!save), used when a command is given no place or "me" (see locations.py)
+locations_path = 'locations.sqlite'
+locations_delay = 5 # seconds between two writes of the changes to the file
+
+# Reminders (a!remind), kept until they are sent in reminders_path (see reminders.py)
+reminders_path = 'reminders.sqlite'
+reminders_per_user = 25 # most reminders waiting per user
+reminders_burst = 10 # most reminders sent per second (those missed while the bot was down are sent this way when it restarts)
+
+# The database can be reloaded without restarting the bot (a!reload, or the signal SIGHUP), once new files are moved into db/
+admins = [] # Discord ids of the users allowed to run a!reload, like ['123456789012345678']
+
 # this command is awfully documented for now (like most of discord.py, actually...), so let's do a custom command for now.
 client.remove_command('help')
 
@@ -41,8 +71,23 @@ async def on_ready():
 	print('--------')
 
 
-@client.command()
-async def time(*, input=''):
+def savedPlace(ctx):
+	"""
+	Returns the place saved by the author of a command, or else by their server (None if there is none).
+	"""
+	message = ctx.message
+	return places.get(message.author.id, message.server.id if message.server is not None else None)
+
+
+def notice(title, text):
+	"""
+	Returns the embed of a short answer of run.py itself.
+	"""
+	return discord.Embed(title=title, description=text, color=int('808080', 16))
+
+
+@client.command(pass_context=True)
+async def time(ctx, *, input=''):
 	"""
 	Tells the current time for a city, a country or a timezone.
 	
@@ -50,53 +95,64 @@ async def time(*, input=''):
 	`a!time Athens` will tell the current time at Athens.
 	`a!time China` will tell the current time at Beijing (capital of China)
 	`a!time CET` will tell the current time in the timezone CET (Central European Time)
+	`a!time 48.85,2.35` will tell the current time at the city nearest to these coordinates (Paris)
+	`a!time` will tell the current time at the place you saved with a!save
 	
 	For more info, check the wiki at github.com/Ailothaen/ailotime/wiki
 	"""
-	output = ailotime.command_time(input)
-	embed_answer = discord.Embed(title=output.title, description='\n'.join(output.description), color=int(output.color, 16))
+	saved = savedPlace(ctx)
+	output = await pool.run(ailotime.command_time, input, saved, key=ailotime.inputKey(input, saved))
+	with metrics.stage('time', 'embed'):
+		embed_answer = discord.Embed(title=output.title, description='\n'.join(output.description), color=int(output.color, 16))
 	
 	await client.say(embed=embed_answer)
 	
 
-@client.command()
-async def conv(*, input=''):
+@client.command(pass_context=True)
+async def conv(ctx, *, input=''):
 	"""
 	Convert a date or a time set in a timezone into another(s) timezone(s).
 	
 	Examples:
 	`a!conv 15 at Marseille to Helsinki` converts 15:00 in Marseille time to Helsinki time
-	`a!time 16,1am at Moscow to London` converts 1:00 (or 1 AM) on the 16th day-of-month in Moscow time to London time
+	`a!time 16,1am at Moscow to London` converts 1:00 (or 1 AM) on the next 16th day-of-month (this month, or next month if it is past) in Moscow time to London time
 	`a!time 11:03 in CET to PST` converts 11:03 in Central European time to Pacific Standard Time
 	`a!time 23/02,21:00 in Reykjavík(IS) to Los Angeles, New York City, Moscow, JP` converts 21:00 on the February 23 in Reyjavík time to Los Angeles, New York City, Moscow and Tokyo time
+	`a!conv 9-17 every 1h at Paris to Tokyo, New York, Sydney` shows a timetable of Paris, Tokyo, New York and Sydney time, every hour from 9:00 to 17:00 in Paris time
+	`a!conv 15 at me to Tokyo` converts 15:00 at the place you saved with a!save to Tokyo time
 	
 	For more info, check the wiki at github.com/Ailothaen/ailotime/wiki
 	"""
-	output = ailotime.command_conv(input)
-	embed_answer = discord.Embed(title=output.title, description='\n'.join(output.description), color=int(output.color, 16))
+	saved = savedPlace(ctx)
+	output = await pool.run(ailotime.command_conv, input, saved, key=ailotime.inputKey(input, saved))
+	with metrics.stage('conv', 'embed'):
+		embed_answer = discord.Embed(title=output.title, description='\n'.join(output.description), color=int(output.color, 16))
 	
 	await client.say(embed=embed_answer)
 
 	
-@client.command()
-async def sun(*, input=''):
+@client.command(pass_context=True)
+async def sun(ctx, *, input=''):
 	"""
 	Displays some info about the sun in some city, like sunset or sunrise for that day.
 	
 	Examples:
 	`a!sun Berlin` displays sun info about Berlin.
 	`a!sun SK` displays sun info about Bratislava (capital of Slovakia, or SK).
+	`a!sun 64.1,-21.9` displays sun info about the city nearest to these coordinates.
 	
 	For more info, check the wiki at github.com/Ailothaen/ailotime/wiki
 	"""
-	output = ailotime.command_sun(input, detailed=False)
-	embed_answer = discord.Embed(title=output.title, description='\n'.join(output.description), color=int(output.color, 16))
+	saved = savedPlace(ctx)
+	output = await pool.run(ailotime.command_sun, input, False, saved, key=(ailotime.inputKey(input, saved), False))
+	with metrics.stage('sun', 'embed'):
+		embed_answer = discord.Embed(title=output.title, description='\n'.join(output.description), color=int(output.color, 16))
 	
 	await client.say(embed=embed_answer)
 
 	
-@client.command()
-async def sundetails(*, input=''):
+@client.command(pass_context=True)
+async def sundetails(ctx, *, input=''):
 	"""
 	Same as a!sun but more detailed.
 	
@@ -106,12 +162,162 @@ async def sundetails(*, input=''):
 	
 	For more info, check the wiki at github.com/Ailothaen/ailotime/wiki
 	"""
-	output = ailotime.command_sun(input, detailed=True)
-	embed_answer = discord.Embed(title=output.title, description='\n'.join(output.description), color=int(output.color, 16))
+	saved = savedPlace(ctx)
+	output = await pool.run(ailotime.command_sun, input, True, saved, key=(ailotime.inputKey(input, saved), True))
+	with metrics.stage('sun', 'embed'):
+		embed_answer = discord.Embed(title=output.title, description='\n'.join(output.description), color=int(output.color, 16))
+	
+	await client.say(embed=embed_answer)
+
+
+@client.command(pass_context=True)
+async def dst(ctx, *, input=''):
+	"""
+	Tells when the clocks last changed, and when they will change next, in a city, a country or a timezone.
+	
+	Examples:
+	`a!dst Paris` tells when the clocks change in Paris (summer time).
+	`a!dst Australia/Sydney` tells when the clocks change in the timezone Australia/Sydney.
+	
+	For more info, check the wiki at github.com/Ailothaen/ailotime/wiki
+	"""
+	saved = savedPlace(ctx)
+	output = await pool.run(ailotime.command_dst, input, saved, key=ailotime.inputKey(input, saved))
+	with metrics.stage('dst', 'embed'):
+		embed_answer = discord.Embed(title=output.title, description='\n'.join(output.description), color=int(output.color, 16))
 	
 	await client.say(embed=embed_answer)
 
 
+@client.command(pass_context=True)
+async def remind(ctx, *, input=''):
+	"""
+	Reminds you of something at a time of a city, a country or a timezone (in the same channel).
+	
+	Examples:
+	`a!remind 16,9am at Tokyo to "standup"` reminds you of the standup at 9:00 (Tokyo time) on the next 16th day-of-month
+	`a!remind Friday, 18:30 at Paris to call Bob` reminds you to call Bob next Friday at 18:30 (Paris time)
+	`a!remind 9am to water the plants` reminds you at 9:00 at the place you saved with a!save
+	
+	For more info, check the wiki at github.com/Ailothaen/ailotime/wiki
+	"""
+	message = ctx.message
+	output = await pool.run(ailotime.command_remind, input, savedPlace(ctx))
+	if output.success and reminders.add(output.reminder[0], message.author.id, message.channel.id, output.reminder[1]) is None:
+		await client.say(embed=notice(':warning: Something went wrong', 'You already have {} reminders waiting, I cannot remember more.'.format(reminders_per_user)))
+		return
+	
+	await client.say(embed=discord.Embed(title=output.title, description='\n'.join(output.description), color=int(output.color, 16)))
+
+
+async def sendReminder(reminder, late):
+	"""
+	Sends a reminder that is due (see ReminderStore.run()), in its channel, or to its user if the channel cannot be found.
+	"""
+	instant, id, user, channel, text = reminder
+	description = text
+	if late > 60: # the bot was down
+		description += '\n\n(Sorry, I am late: I was offline when it was due.)'
+	
+	destination = client.get_channel(channel)
+	if destination is None: # private channel not known since the bot started, or channel deleted
+		destination = await client.get_user_info(user)
+	await client.send_message(destination, '<@{}>'.format(user), embed=notice(':alarm_clock: Reminder', description))
+
+
+async def sendReminders():
+	await client.wait_until_ready()
+	await reminders.run(sendReminder)
+
+
+@client.command(pass_context=True)
+async def save(ctx, *, input=''):
+	"""
+	Saves your place: the commands given no place, or "me" as a place, will use it.
+	
+	Examples:
+	`a!save Lyon` saves Lyon, then `a!time` tells the current time at Lyon.
+	`a!save Europe/Paris` saves the timezone Europe/Paris.
+	"""
+	output = await pool.run(ailotime.command_save, input, 'user')
+	if output.success:
+		places.save('user', ctx.message.author.id, output.place)
+	
+	await client.say(embed=discord.Embed(title=output.title, description='\n'.join(output.description), color=int(output.color, 16)))
+
+
+@client.command(pass_context=True)
+async def saveserver(ctx, *, input=''):
+	"""
+	Saves the place of the server (for the members who did not save theirs). Needs the permission to manage the server.
+	
+	Examples:
+	`a!saveserver Montreal` saves Montreal for this server.
+	"""
+	message = ctx.message
+	if message.server is None or not message.author.server_permissions.manage_server:
+		await client.say(embed=notice(':warning: Something went wrong', 'Only the members who can manage a server can save its place, on that server.'))
+		return
+	
+	output = await pool.run(ailotime.command_save, input, 'server')
+	if output.success:
+		places.save('server', message.server.id, output.place)
+	
+	await client.say(embed=discord.Embed(title=output.title, description='\n'.join(output.description), color=int(output.color, 16)))
+
+
+@client.command(pass_context=True)
+async def forget(ctx):
+	"""
+	Forgets the place you saved.
+	"""
+	if places.forget('user', ctx.message.author.id):
+		await client.say(embed=notice('Place forgotten', 'Your saved place has been forgotten.'))
+	else:
+		await client.say(embed=notice('Nothing to forget', 'You have not saved a place.'))
+
+
+@client.command(pass_context=True)
+async def forgetserver(ctx):
+	"""
+	Forgets the place of the server. Needs the permission to manage the server.
+	"""
+	message = ctx.message
+	if message.server is None or not message.author.server_permissions.manage_server:
+		await client.say(embed=notice(':warning: Something went wrong', 'Only the members who can manage a server can forget its place, on that server.'))
+	elif places.forget('server', message.server.id):
+		await client.say(embed=notice('Place forgotten', 'The place of this server has been forgotten.'))
+	else:
+		await client.say(embed=notice('Nothing to forget', 'This server has not saved a place.'))
+
+
+async def reloadDatabase(trigger):
+	"""
+	Reloads the database (see CommandPool.reload()), asked by trigger (for the log). Returns the embed telling how it went.
+	"""
+	logger.info('Reloading the database (%s)', trigger)
+	try:
+		database = await pool.reload()
+	except Exception as e:
+		logger.exception('Cannot reload the database, the previous one is still used')
+		return notice(':warning: Something went wrong', 'The database could not be reloaded, the previous one is still used ({}).'.format(e))
+	
+	logger.info('Database reloaded: %s cities', len(database.cities))
+	return notice('Database reloaded', '{} cities.'.format(len(database.cities)))
+
+
+@client.command(pass_context=True)
+async def reload(ctx):
+	"""
+	Reloads the database without restarting the bot. Only for the admins of the bot.
+	"""
+	if ctx.message.author.id not in admins:
+		await client.say(embed=notice(':warning: Something went wrong', 'Only the admins of the bot can reload its database.'))
+		return
+	
+	await client.say(embed=await reloadDatabase('a!reload by '+ctx.message.author.id))
+
+
 @client.command()
 async def help():
 	"""
@@ -123,5 +329,20 @@ async def help():
 	
 	await client.say(embed=embed_answer)
 
-# Let's go
+# Let's go (the pool loads the database now rather than at the first command)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s') # warnings of the pool, metrics summaries...
+if metrics_port is not None or metrics_log_interval is not None:
+	metrics.enable() # before creating the pool, so that worker processes record them too
+	if metrics_port is not None:
+		metrics.serve(metrics_port)
+	if metrics_log_interval is not None:
+		metrics.log_every(metrics_log_interval)
+pool = CommandPool(pool_kind, workers=pool_workers, queue=pool_queue, timeout=command_timeout)
+places = LocationStore(locations_path, delay=locations_delay)
+reminders = ReminderStore(reminders_path, burst=reminders_burst, limit=reminders_per_user)
+client.loop.create_task(sendReminders())
+if hasattr(signal, 'SIGHUP'): # not on Windows
+	client.loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(reloadDatabase('SIGHUP'), loop=client.loop))
 client.run(token)
+places.close() # writes the last changes
+reminders.close()
@@ -0,0 +1,146 @@
+#-------------------------------------------------------------------------------
+# Name:			solar
+# Purpose:		Vectorized sun events (dawn, sunrise, noon, sunset, dusk) for many places and dates at once
+#
+# Author:		Ailothaen (#3768)
+# Created:		october 2026
+#-------------------------------------------------------------------------------
+
+import numpy as np
+
+"""
+Same model as astral (NOAA solar calculator equations, evaluated once per day), computed with NumPy on whole arrays.
+Every input can be an array or a scalar; they are broadcast together, so that one call can compute hundreds of cities on one date, one
+city on hundreds of dates, or a full grid of both.
+
+Instants are returned as numpy.datetime64 (UTC, second precision), NaT when the event does not happen that day.
+Given the same local time as astral 1.x (as ailotime.sunrise_sunset() does), results agree with it within a second, polar days and
+nights included. Given dates only, the position of the sun is evaluated at 00:00, which moves the events by up to 15 seconds for noon
+and a few minutes elsewhere, up to 30 minutes when the sun barely reaches the elevation of an event (near the polar circles).
+"""
+
+# depression of the sun under the horizon for each event (sunrise and sunset include refraction and the radius of the sun)
+depressions = {
+'astronomical': 18.0,
+'nautical': 12.0,
+'civil': 6.0,
+'horizon': 0.833
+}
+EARTH_RADIUS = 6356900 # metres, as in astral
+
+
+
+#--------------------------------------------------#
+# Functions                                        #
+#--------------------------------------------------#
+
+def julianDay(dates):
+	"""
+	Returns the julian day of dates (numpy.datetime64[s]).
+	"""
+	return dates.astype('int64')/86400.0+2440587.5
+
+
+def sunPosition(julianday):
+	"""
+	Returns the declination of the sun (degrees) and the equation of time (minutes) for julian days.
+	"""
+	t = (julianday-2451545.0)/36525.0
+	
+	l0 = np.mod(280.46646+t*(36000.76983+0.0003032*t), 360.0) # geometric mean longitude
+	m = 357.52911+t*(35999.05029-0.0001537*t) # geometric mean anomaly
+	e = 0.016708634-t*(0.000042037+0.0000001267*t) # eccentricity of the orbit
+	
+	mrad = np.radians(m)
+	c = np.sin(mrad)*(1.914602-t*(0.004817+0.000014*t))+np.sin(2*mrad)*(0.019993-0.000101*t)+np.sin(3*mrad)*0.000289
+	omega = np.radians(125.04-1934.136*t)
+	apparentLongitude = np.radians(l0+c-0.00569-0.00478*np.sin(omega))
+	
+	seconds = 21.448-t*(46.815+t*(0.00059-t*0.001813))
+	obliquity = np.radians(23.0+(26.0+seconds/60.0)/60.0+0.00256*np.cos(omega))
+	declination = np.degrees(np.arcsin(np.sin(obliquity)*np.sin(apparentLongitude)))
+	
+	y = np.tan(obliquity/2.0)**2
+	l0rad = np.radians(l0)
+	equation = y*np.sin(2*l0rad)-2*e*np.sin(mrad)+4*e*y*np.sin(mrad)*np.cos(2*l0rad)-0.5*y*y*np.sin(4*l0rad)-1.25*e*e*np.sin(2*mrad)
+	
+	return declination, np.degrees(equation)*4.0
+
+
+def elevationAdjustment(altitudes):
+	"""
+	Returns the extra depression (degrees) of the horizon seen from an altitude (metres, ignored if not above 0).
+	"""
+	altitudes = np.maximum(np.asarray(altitudes, dtype='float64'), 0.0)
+	theta = np.arccos(EARTH_RADIUS/(EARTH_RADIUS+altitudes))
+	a = EARTH_RADIUS*np.sin(theta)
+	b = EARTH_RADIUS-EARTH_RADIUS*np.cos(theta)
+	with np.errstate(invalid='ignore'):
+		return np.where(altitudes > 0.0, np.degrees(np.arccos(a/np.hypot(a, b))), 0.0)
+
+
+def hourAngle(latitudes, declinations, depression):
+	"""
+	Returns the cosine of the hour angle at which the sun is at depression degrees under the horizon.
+	Beyond [-1, 1], it never goes that low (< -1) or that high (> 1) on that day.
+	"""
+	latitudes = np.radians(latitudes)
+	declinations = np.radians(declinations)
+	return np.cos(np.radians(90.0+depression))/(np.cos(latitudes)*np.cos(declinations))-np.tan(latitudes)*np.tan(declinations)
+
+
+def toInstants(dates, minutes):
+	"""
+	Turns minutes after 00:00 UTC of dates into numpy.datetime64 instants (NaT where minutes is NaN).
+	"""
+	midnight = np.asarray(dates, dtype='datetime64[D]').astype('datetime64[s]')
+	seconds = np.floor(minutes*60.0)
+	instants = midnight+np.where(np.isnan(seconds), 0, seconds).astype('int64').astype('timedelta64[s]')
+	return np.where(np.isnan(seconds), np.datetime64('NaT'), instants)
+
+
+def events(latitudes, longitudes, altitudes, dates):
+	"""
+	Calculates the sun events of places (latitude and longitude in degrees, altitude in metres) on dates.
+	dates are anything numpy.datetime64 accepts (datetime.date, 'YYYY-MM-DD'...); if they have a time, the position of the sun is evaluated
+	at that time of the day, as astral does with the (local) time it is given.
+	Returns a dictionary of arrays (all of the broadcast shape of the inputs):
+	- dawn_astronomical, dawn_nautical, dawn_civil, sunrise, noon, sunset, dusk_civil, dusk_nautical, dusk_astronomical, midnight: instants
+	  (midnight is the solar midnight closest to 00:00 UTC of the date, as in astral)
+	- polar_day, polar_night: whether the sun stays above, or under, the horizon for the whole day
+	"""
+	latitudes, longitudes, altitudes, days = np.broadcast_arrays(
+		np.clip(np.asarray(latitudes, dtype='float64'), -89.8, 89.8),
+		np.asarray(longitudes, dtype='float64'),
+		np.asarray(altitudes, dtype='float64'),
+		np.asarray(dates, dtype='datetime64[s]')
+	)
+	
+	julianday = julianDay(days)
+	days = days.astype('datetime64[D]')
+	declination, equation = sunPosition(julianday)
+	adjustment = elevationAdjustment(altitudes)
+	
+	sun = {}
+	for name, depression in depressions.items():
+		cosine = hourAngle(latitudes, declination, depression+adjustment)
+		with np.errstate(invalid='ignore'):
+			angle = np.degrees(np.arccos(cosine)) # NaN when the sun does not reach that depression
+		
+		rising = toInstants(days, 720.0+4.0*(-longitudes-angle)-equation)
+		setting = toInstants(days, 720.0+4.0*(-longitudes+angle)-equation)
+		
+		if name == 'horizon':
+			sun['sunrise'], sun['sunset'] = rising, setting
+			sun['polar_day'] = cosine < -1.0
+			sun['polar_night'] = cosine > 1.0
+		else:
+			sun['dawn_'+name], sun['dusk_'+name] = rising, setting
+	
+	sun['noon'] = toInstants(days, 720.0-4.0*longitudes-equation)
+	
+	# astral evaluates solar midnight half a day (plus the longitude) after 00:00 UTC
+	_, equationMidnight = sunPosition(julianday+0.5-longitudes/360.0)
+	sun['midnight'] = toInstants(days, -4.0*longitudes-equationMidnight)
+	
+	return sun
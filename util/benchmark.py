@@ -0,0 +1,432 @@
+import argparse
+import datetime as dt
+import itertools
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+
+"""
+This file is meant to be used manually (or by CI) to track the performance of ailotime.
+Each run starts a fresh Python process, from another directory than the repository, and measures:
+- import: time taken by "import ailotime"
+- first_time: time taken by the first command_time() answer after that (database loading and heavy imports included)
+Then, in this process:
+- time_parser: average time taken by ailotime.time_parser.parse() on a corpus of times written in all the accepted formats
+- time_strptime: the same with the former way (trying each format of acceptedFormats with strptime()), for comparison
+Both are checked to give the same results on the whole corpus, invalid times included.
+- input parsers: the results of the parse_input_*() functions compared to the former ones (the regular expressions they replaced) on
+  a corpus of generated inputs. Only the documented differences are allowed (see formerDifference()).
+- parse_adversarial: the longest time taken by a parse_input_*() function on inputs crafted to make regular expressions backtrack,
+  of adversarialLengths[-1] characters. The time must grow linearly with the length: from each length to the next, it may at most
+  be multiplied by the ratio of the lengths times adversarialSlack.
+- the command pipeline, stage by stage, on the fixed corpus of corpus.json (cities, countries, timezones, misspelled places,
+  polar cities, coordinates (oceans and poles included), every time format, conversions to 1, 5 and 25 places, timetables of 24 times for 10 places): average time per call of parse_input_*(), parse_location()
+  (cities, with country codes, countries, timezones, coordinates, misses), suggestPlaces(), parse_time(), colorTime(), sunrise_sunset() and
+  command_*(). "_cold" stages empty the caches of ailotime before each repetition.
+The median of all runs is compared to the budgets; the script exits with 1 if one is exceeded, if the time parsers disagree, or if
+the input parsers differ from the former ones otherwise than documented.
+Use --only to run some groups of benchmarks, and --json to compare the results of runs (like in CI).
+"""
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+import ailotime
+
+# seconds
+budgets = {
+'import': 0.1,
+'first_time': 0.5,
+'time_parser': 0.00002,
+'time_strptime': None,
+'parse_adversarial': 0.02,
+'parse_location_coordinates': 0.001
+}
+
+# values written for each directive of the time formats, invalid ones included
+directiveSamples = {
+'A': ['Monday', 'sunday', 'FRIDAY', 'Tue', 'wed', 'Funday'],
+'d': ['1', '01', ' 5', '17', '31', '32', '0'],
+'m': ['2', '02', '12', '13', '0'],
+'Y': ['2026', '2024', '1900', '0000', '226'],
+'H': ['0', '7', '07', '19', '23', '24'],
+'I': ['12', '1', '01', '11', '13', '0'],
+'M': ['5', '05', '30', '59', '60'],
+'p': ['am', 'PM', 'Pm', 'xm']
+}
+separatorSamples = [', ', ',', ',  ', ',\t', ' ']
+
+# inputs of the parsers, repeating a pattern (the second string) between a prefix and a suffix
+adversarialPatterns = [
+('10 at Paris to ', 'a ', '!'),
+('10 at Paris to ', 'a, ', '('),
+('10 at Paris to ', 'a (FR), ', '(F'),
+('', 'a ', 'at'),
+('10 at ', 'a to ', '!'),
+('', ' at', ''),
+('', '1,', ' at'),
+('', '(', ''),
+('Paris ', '(FR)', '')
+]
+adversarialLengths = [250, 500, 1000, 2000, 4000] # a Discord message is 2000 characters at most
+adversarialSlack = 3
+
+# pieces of the inputs of the parsers, combined at random (see inputCorpus())
+inputTimes = ['15:30', '9am', '9 am', 'Monday, 9am', 'monday,9am', '16, 9am', '2026/10/17, 15:30', '17/10/2026,9pm', '9-17', '9am-5pm', 'Monday, 9-17', '0-23 every 1h', 'noon!']
+inputPlaces = ['Paris', 'aix-en-provence', "L'Aquila", 'New  York', ' Lyon ', 'Paris (FR)', 'paris(fr)', 'Zürich', 'Zürich (CH)', 'São Paulo (BR)', 'Europe/Paris', 'Etc/GMT+3', 'St. Louis', '48.85,2.35', '-33.9, 18.4', 'Saint-Martin in Paris', 'Paris (FRA)', 'Paris!', '']
+inputKeywords = (('at', 'in'), ('to', 'into'))
+
+startup = '''
+import sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import ailotime
+imported = time.perf_counter()
+ailotime.command_time('Paris')
+answered = time.perf_counter()
+print(imported-start, answered-imported)
+'''
+
+
+def bench_startup(runs):
+	"""
+	Returns the median import and first answer times over several fresh processes.
+	"""
+	results = {'import': [], 'first_time': []}
+	
+	with tempfile.TemporaryDirectory() as directory:
+		for i in range(runs):
+			output = subprocess.run([sys.executable, '-c', startup.format(root=ROOT)], cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, universal_newlines=True).stdout
+			imported, answered = output.split()
+			results['import'].append(float(imported))
+			results['first_time'].append(float(answered))
+	
+	return {name: statistics.median(values) for name, values in results.items()}
+
+
+def strptimeReference(input):
+	"""
+	The former parsing of ailotime.parse_time(): each format of acceptedFormats tried in turn with strptime().
+	Returns the same dictionary as ailotime.time_parser.parse().
+	"""
+	for typeOfTime, format in ailotime.acceptedFormats:
+		try:
+			parsed = dt.datetime.strptime(input, format)
+		except ValueError:
+			continue
+		
+		data = {'type': typeOfTime, 'weekday': None, 'year': None, 'month': None, 'day': None, 'hour': parsed.hour, 'minute': parsed.minute}
+		if typeOfTime == 'week':
+			data['weekday'] = ailotime.weekdayName_to_weekdayNumber(re.match(r"^([A-Za-z]+),", input).groups()[0])
+		if typeOfTime in ('day', 'complete'):
+			data['day'] = parsed.day
+		if typeOfTime == 'complete':
+			data['year'], data['month'] = parsed.year, parsed.month
+		return data
+	
+	raise ValueError
+
+
+def timeCorpus(size):
+	"""
+	Returns times written in every accepted format (size of each), with random valid and invalid values and separators.
+	"""
+	generator = random.Random(0)
+	corpus = []
+	
+	for typeOfTime, format in ailotime.acceptedFormats:
+		parts = re.split(r'(%\w|, )', format)
+		for i in range(size):
+			written = ''
+			for part in parts:
+				if part == ', ':
+					written += generator.choice(separatorSamples)
+				elif part.startswith('%'):
+					written += generator.choice(directiveSamples[part[1]])
+				else:
+					written += part
+			corpus.append(written)
+	
+	return corpus
+
+
+def parseOrError(function, input):
+	try:
+		return function(input)
+	except ValueError:
+		return 'ValueError'
+
+
+def bench_time_parser(size):
+	"""
+	Returns the average time of both time parsers on the corpus, and the times they disagree on.
+	"""
+	corpus = timeCorpus(size)
+	disagreements = [input for input in corpus if parseOrError(ailotime.time_parser.parse, input) != parseOrError(strptimeReference, input)]
+	
+	results = {}
+	for name, function in (('time_parser', ailotime.time_parser.parse), ('time_strptime', strptimeReference)):
+		duration = min(timeit.repeat(lambda: [parseOrError(function, input) for input in corpus], number=1, repeat=5))
+		results[name] = duration/len(corpus)
+	
+	return results, disagreements
+
+
+def formerCountryCode(place):
+	"""
+	The former separateCountryCodes() of ailotime: [place, country code or None].
+	"""
+	match = re.match(r"^([A-Za-z0-9'/\-\s]+)\s?\(([A-Za-z]{2})\)?$", place)
+	if match:
+		return [match.groups()[0].strip(), match.groups()[1]]
+	return [place, None]
+
+
+def formerParseTime(input):
+	"""
+	The former parse_input_time() of ailotime, with regular expressions (the others too). Returns the same dictionary.
+	"""
+	match = re.match(r"^([\w\s'’`-]+\s?(?:\([A-Za-z]{2}\))?)$", input)
+	if not match:
+		raise ValueError
+	return {'type': 'simple', 'source': formerCountryCode(match.groups()[0])}
+
+
+def formerParseConv(input):
+	match = re.match(r"^([A-Za-z0-9,:/\-\s]+) (?:at|in) ([\w\s'’`-]+\s?(?:\([A-Za-z]{2}\))?) (?:to|into) ((?:[\w\s'’`-]+\s?(?:\([A-Za-z]{2}\))?,?\s?)+)$", input)
+	if not match:
+		raise ValueError
+	targets = [formerCountryCode(place.strip()) for place in match.groups()[2].split(',')]
+	return {'type': 'conversion', 'source': formerCountryCode(match.groups()[1]), 'targets': targets, 'time': match.groups()[0]}
+
+
+def formerParseSun(input):
+	other = re.match(r"^([A-Za-z0-9,:/\-\s]+) (?:at|in) ([\w\s'’`-]+\s?(?:\([A-Za-z]{2}\))?)$", input)
+	if other:
+		return {'type': 'other', 'time': other.groups()[0], 'source': formerCountryCode(other.groups()[1])}
+	now = re.match(r"^([\w\s'’`-]+\s?(?:\([A-Za-z]{2}\))?)$", input)
+	if now:
+		return {'type': 'now', 'source': formerCountryCode(now.groups()[0])}
+	raise ValueError
+
+
+def inputCorpus(size):
+	"""
+	Returns inputs of each parser (size of each) as (parser, former parser, input): places, and times at places to places.
+	"""
+	generator = random.Random(0)
+	place = lambda: generator.choice(inputPlaces)
+	keyword = lambda i: generator.choice(inputKeywords[i])
+	corpus = []
+	
+	# the former parser of a!conv takes seconds (or ages) to reject invalid targets: they are left out
+	valid = [target for target in inputPlaces if re.fullmatch(r"[\w\s'’`-]+(?:\([A-Za-z]{2}\))?", target)]
+	
+	for i in range(size):
+		corpus.append((ailotime.parse_input_time, formerParseTime, place()))
+		corpus.append((ailotime.parse_input_sun, formerParseSun, place() if i % 2 else '{} {} {}'.format(generator.choice(inputTimes), keyword(0), place())))
+		
+		targets = generator.choice((', ', ',')).join(generator.choice(valid) for j in range(generator.randint(1, 4)))+generator.choice(('', '', ','))
+		corpus.append((ailotime.parse_input_conv, formerParseConv, '{} {} {} {} {}'.format(generator.choice(inputTimes), keyword(0), place(), keyword(1), targets)))
+	
+	return corpus
+
+
+def formerDifference(former, current):
+	"""
+	Returns the documented difference between the results of a former parser and of the current one (None if there is none, or if
+	they differ otherwise). A result is a dictionary, or 'ValueError'.
+	"""
+	def normalised(data):
+		if data == 'ValueError':
+			return data
+		data = dict(data)
+		for name in ('source', 'targets'):
+			if name in data:
+				places = [data[name]] if name == 'source' else data[name]
+				places = [[name.strip() for name in re.fullmatch(r"(.*?)\s*(?:\(([A-Za-z]{2})\))?", place.strip()).groups('')] if countrycode is None else [place.strip(), countrycode] for place, countrycode in places]
+				places = [[place, countrycode or None] for place, countrycode in places]
+				data[name] = places[0] if name == 'source' else places
+		if 'time' in data:
+			data['time'] = ', '.join(part.strip() for part in data['time'].split(','))
+		return data
+	
+	former, current = normalised(former), normalised(current)
+	if former == current:
+		return 'names stripped, country codes after non-ASCII names, commas of the times'
+	
+	if current != 'ValueError':
+		places = [current['source']]+current.get('targets', [])
+		if former == 'ValueError' and any(place == '' or re.search(r"[./+]", place) for place, countrycode in places):
+			return "empty places, places with '/', '+' or '.', coordinates"
+		if former != 'ValueError' and former.get('targets', [None])[-1] == ['', None] and dict(former, targets=former['targets'][:-1]) == current:
+			return 'trailing comma after the targets'
+		if current['type'] == 'timetable' and (former == 'ValueError' or former['time'].split(' every ')[0] == current['time']+'-'+current['until']):
+			return 'timetables'
+	
+	if former != 'ValueError' and re.search(r"\s(?:at|in|to|into)\s", former.get('time', '')+' '+former['source'][0]+' '):
+		return "time before the first 'at'/'in', source before the first 'to'/'into'"
+	
+	return None
+
+
+def check_input_parsers(size):
+	"""
+	Returns the inputs the parsers give other results for than the former ones, except for the documented differences.
+	"""
+	mismatches = []
+	for function, former, input in inputCorpus(size):
+		if formerDifference(parseOrError(former, input), parseOrError(function, input)) is None:
+			mismatches.append((function.__name__, input))
+	return mismatches
+
+
+def bench_adversarial():
+	"""
+	Returns the longest time taken by the input parsers for each length of adversarial inputs.
+	"""
+	functions = (ailotime.parse_input_time, ailotime.parse_input_conv, ailotime.parse_input_sun)
+	durations = {}
+	
+	for length in adversarialLengths:
+		durations[length] = 0
+		for prefix, pattern, suffix in adversarialPatterns:
+			input = prefix+pattern*((length-len(prefix)-len(suffix))//len(pattern))+suffix
+			for function in functions:
+				duration = min(timeit.repeat(lambda: parseOrError(function, input), number=1, repeat=5))
+				durations[length] = max(durations[length], duration)
+	
+	return durations
+
+
+def nonlinear(durations):
+	"""
+	Returns the lengths from which the time grows faster than linearly (beyond adversarialSlack).
+	"""
+	lengths = sorted(durations)
+	return [after for before, after in zip(lengths, lengths[1:]) if durations[after] > durations[before]*after/before*adversarialSlack]
+
+
+def pipelineCases(corpus):
+	"""
+	Returns the stages of the pipeline to benchmark: (name, function, list of arguments, whether caches are emptied before each repetition).
+	"""
+	places = corpus['places']+corpus['polar']
+	cities = [ailotime.parse_location(*ailotime.parse_input_time(place)['source']) for place in places]
+	withCodes = [place for place in places if place.endswith(')')]
+	located = [(dt.datetime.strptime(date, '%Y-%m-%d, %H'), city) for date in corpus['dates'] for city in cities]
+	located = [(city.timezone_pytz.localize(date), city) for date, city in located]
+	detailed = ('ra', 'rn', 'rc', 'r', 's', 'sc', 'sn', 'sa', 'sol_n', 'sol_m', 'day')
+	
+	targets = itertools.cycle(places+corpus['timezones']+corpus['countries'])
+	conversions = {}
+	for count in corpus['conv_targets']:
+		conversions[count] = ['{} at {} to {}'.format(time, place, ', '.join(next(targets) for i in range(count))) for time, place in zip(corpus['times'], itertools.cycle(places))]
+	
+	everything = places+corpus['countries']+corpus['timezones']+corpus['aliases']+corpus['misses']
+	suns = places+['{} at {}'.format(date, place) for date in corpus['dates'] for place in corpus['polar']]
+	
+	cases = [
+	('parse_input_time', ailotime.parse_input_time, [(place,) for place in everything], False),
+	('parse_input_conv', ailotime.parse_input_conv, [(input,) for input in conversions[max(conversions)]], False),
+	('parse_input_sun', ailotime.parse_input_sun, [(input,) for input in suns], False),
+	('parse_location_cities', ailotime.parse_location, [ailotime.parse_input_time(place)['source'] for place in places], False),
+	('parse_location_cc', ailotime.parse_location, [ailotime.parse_input_time(place)['source'] for place in withCodes], False),
+	('parse_location_countries', ailotime.parse_location, [(place,) for place in corpus['countries']], False),
+	('parse_location_timezones', ailotime.parse_location, [(place,) for place in corpus['timezones']], False),
+	('parse_location_coordinates', ailotime.parse_location, [ailotime.parse_input_time(place)['source'] for place in corpus['coordinates']], False),
+	('parse_location_misses', ailotime.parse_location, [ailotime.parse_input_time(place)['source'] for place in corpus['misses']], False),
+	('suggest_places', ailotime.suggestPlaces, [ailotime.parse_input_time(place)['source'] for place in corpus['misses']], False),
+	('parse_time', ailotime.parse_time, [(time, timezone) for time in corpus['times'] for timezone in ('Europe/Paris', 'America/New_York', 'Asia/Kolkata')], False),
+	('color_time', ailotime.colorTime, [(date, city.latitude, city.longitude, city.altitude, city.timezone_str) for date, city in located], False),
+	('color_time_cold', ailotime.colorTime, [(date, city.latitude, city.longitude, city.altitude, city.timezone_str) for date, city in located], True),
+	('sunrise_sunset', ailotime.sunrise_sunset, [(date, city.latitude, city.longitude, city.altitude, detailed) for date, city in located], False),
+	('command_time', ailotime.command_time, [(place,) for place in everything], False),
+	('command_time_cold', ailotime.command_time, [(place,) for place in everything], True),
+	('command_dst', ailotime.command_dst, [(place,) for place in places+corpus['countries']+corpus['timezones']], False),
+	('command_sun', ailotime.command_sun, [(input, detailed) for input in suns for detailed in (False, True)], False),
+	('command_sun_cold', ailotime.command_sun, [(input, detailed) for input in suns for detailed in (False, True)], True),
+	('command_remind', ailotime.command_remind, [('{} at {} to "check"'.format(time, place),) for time, place in zip(corpus['times'], itertools.cycle(places))], False)
+	]
+	for count, inputs in conversions.items():
+		cases.append(('command_conv_{}'.format(count), ailotime.command_conv, [(input,) for input in inputs], False))
+	timetables = ['0-23 every 1h at {} to {}'.format(place, ', '.join(next(targets) for i in range(10))) for place in places]
+	cases.append(('command_conv_timetable', ailotime.command_conv, [(input,) for input in timetables], False))
+	
+	return cases
+
+
+def emptyCaches():
+	ailotime.sun_cache.clear()
+	ailotime.phase_cache.clear()
+	ailotime.time_cache.clear()
+
+
+def bench_pipeline(repeat):
+	"""
+	Returns the average time per call of each stage of the pipeline (the best of several repetitions).
+	"""
+	with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus.json'), 'r', encoding='UTF-8') as file:
+		corpus = json.load(file)
+	
+	ailotime.init()
+	results = {}
+	
+	for name, function, arguments, cold in pipelineCases(corpus):
+		run = lambda: [parseOrError(lambda args: function(*args), args) for args in arguments]
+		run() # imports, and caches of the warm stages
+		duration = min(timeit.repeat(run, setup=emptyCaches if cold else 'pass', number=1, repeat=repeat))
+		results[name] = duration/len(arguments)
+	
+	return results
+
+
+groups = ('startup', 'time_parser', 'adversarial', 'pipeline')
+parser = argparse.ArgumentParser(description='Benchmarks ailotime.')
+parser.add_argument('--runs', type=int, default=10, help='number of fresh processes (default: 10)')
+parser.add_argument('--corpus', type=int, default=300, help='number of times written in each format for the time parsers, and of inputs of each input parser (default: 300)')
+parser.add_argument('--repeat', type=int, default=5, help='repetitions of each stage of the pipeline, the best is kept (default: 5)')
+parser.add_argument('--only', nargs='+', choices=groups, default=groups, help='groups of benchmarks to run (default: all)')
+parser.add_argument('--json', action='store_true', help='prints the results as JSON')
+args = parser.parse_args()
+
+results = {}
+disagreements = []
+mismatches = []
+adversarial = {}
+growth = []
+
+if 'startup' in args.only:
+	results.update(bench_startup(args.runs))
+if 'time_parser' in args.only:
+	timeResults, disagreements = bench_time_parser(args.corpus)
+	results.update(timeResults)
+if 'adversarial' in args.only:
+	mismatches = check_input_parsers(args.corpus)
+	adversarial = bench_adversarial()
+	results['parse_adversarial'] = adversarial[adversarialLengths[-1]]
+	growth = nonlinear(adversarial)
+if 'pipeline' in args.only:
+	results.update(bench_pipeline(args.repeat))
+
+exceeded = [name for name, value in results.items() if budgets.get(name) is not None and value > budgets[name]]
+
+if args.json:
+	print(json.dumps({'results': results, 'budgets': budgets, 'exceeded': exceeded, 'disagreements': disagreements, 'mismatches': mismatches, 'adversarial': adversarial, 'nonlinear': growth}))
+else:
+	for name, value in results.items():
+		budget = '(budget: {:.3f} ms)'.format(budgets[name]*1000) if budgets.get(name) is not None else ''
+		print('{:<30} {:10.3f} ms {}{}'.format(name, value*1000, budget, ' EXCEEDED' if name in exceeded else ''))
+	for input in disagreements:
+		print('time parsers disagree on {!r}: {} (strptime: {})'.format(input, parseOrError(ailotime.time_parser.parse, input), parseOrError(strptimeReference, input)))
+	for name, input in mismatches:
+		print('{} differs from the former parser on {!r}'.format(name, input))
+	if adversarial:
+		print('adversarial inputs: '+', '.join('{} chars {:.3f} ms{}'.format(length, duration*1000, ' NONLINEAR' if length in growth else '') for length, duration in adversarial.items()))
+
+sys.exit(1 if exceeded or disagreements or mismatches or growth else 0)
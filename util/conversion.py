@@ -1,64 +1,317 @@
+import argparse
 import csv
+import heapq
+import os
+import re
+import sys
+import tempfile
 
 """
 This file is meant to be used manually when generating the database CSV files.
 It takes the data from the files "cities15000.txt" and "countryInfo.txt" (see http://download.geonames.org/export/dump/), removes useless info and sort them in the meant order. Then it writes the new data to cities.csv and countries.csv.
+It also writes aliases.csv, the alternate names of the cities (other languages, former names...). By default they come from the alternate names column of "cities15000.txt", which tells no language; with --aliases-languages, they come from "alternateNamesV2.txt" instead (from alternateNamesV2.zip), limited to these languages.
+It also builds ailotime.db, the binary version of these files that ailotime maps at startup (see dbfile.py). Copy the four files into db/.
+With --binary-only, only ailotime.db is rebuilt, from the cities.csv and countries.csv of the current directory.
+
+The dumps are streamed, so that larger ones (--cities cities1000.txt, cities500.txt) can be used: only the columns kept are held, and cities are sorted by chunks of --chunk-rows written to temporary files, then merged. What stays in memory grows with the number of cities written, never with the size of the dumps (their alternate names included), and the alternate names kept are capped by --aliases-max.
+Rows are checked as they are read: malformed rows, invalid country codes and timezones unknown to pytz (which ailotime could not load) are skipped, and counted at the end.
+
+With --modifications and/or --deletes (the daily files modifications-YYYY-MM-DD.txt and deletes-YYYY-MM-DD.txt of GeoNames, several of each in the order of their dates), the cities.csv and aliases.csv of the current directory are updated instead of being rebuilt: deleted cities are removed, modified ones are replaced (or removed if they are no longer cities, see --min-population), new ones are added, and the alternate names of the cities kept are moved to their new rows. The alternate names of modified and new cities are added when they are free (new cities do not take alternate names from the cities already there). Modifications are applied before deletions. countries.csv is left as it is. cities.csv must have its population column (the last one), which older versions of this script did not write: rebuild it first otherwise.
 """
 
-cities = []
-countries = []
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import ailotime
+
+parser = argparse.ArgumentParser(description='Builds the ailotime database from the GeoNames dumps.')
+parser.add_argument('--binary-only', action='store_true', help='only rebuild ailotime.db from the CSV files')
+parser.add_argument('--cities', default='./cities15000.txt', help='GeoNames dump of the cities (default: ./cities15000.txt)')
+parser.add_argument('--aliases-languages', help='comma-separated ISO 639 codes (like de,fr,zh) of the alternate names to keep, read from alternateNamesV2.txt')
+parser.add_argument('--aliases-max', type=int, default=300000, help='maximum number of alternate names; those of the most populous cities are kept (default: 300000)')
+parser.add_argument('--chunk-rows', type=int, default=200000, help='rows sorted in memory at once (default: 200000)')
+parser.add_argument('--modifications', action='append', default=[], help='GeoNames daily modifications file to apply to cities.csv and aliases.csv (repeatable)')
+parser.add_argument('--deletes', action='append', default=[], help='GeoNames daily deletes file to apply to cities.csv and aliases.csv (repeatable)')
+parser.add_argument('--min-population', type=int, help='population from which a modified place is a city (default: the number in the name of --cities, like 15000); capitals always are')
+args = parser.parse_args()
+
+skipped = {} # reason -> rows skipped
+
+
+
+#--------------------------------------------------#
+# Functions                                        #
+#--------------------------------------------------#
+
+def readDump(path):
+	"""
+	Yields the rows of a GeoNames file (tab-separated, never quoted).
+	"""
+	with open(path, 'r', encoding='UTF-8', newline='\n') as file:
+		for line in file:
+			yield line.rstrip('\n').split('\t')
+
+
+def city(row, minimum=None):
+	"""
+	Returns the columns kept of a row of a GeoNames dump of cities (geonameid, name, asciiname, latitude, longitude, country code,
+	elevation, timezone, population), then its alternate names; None if the row is skipped (counted in skipped).
+	If minimum is given, places that are not cities (populated places of at least minimum inhabitants, or capitals) are left out too,
+	without being counted.
+	"""
+	try:
+		if len(row) != 19:
+			raise ValueError
+		int(row[0])
+		latitude, longitude, population = float(row[4]), float(row[5]), int(row[14])
+		int(row[16])
+	except ValueError:
+		reason = 'malformed row'
+	else:
+		if minimum is not None and (row[6] != 'P' or (population < minimum and row[7] != 'PPLC')):
+			return None
+		elif not row[1] or not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+			reason = 'malformed row'
+		elif not re.fullmatch(r"[A-Z]{2}", row[8]):
+			reason = 'invalid country code'
+		elif ailotime.timezones.identifier(row[17]) is None:
+			reason = 'unknown timezone'
+		else:
+			return [row[0], row[1], row[2], row[4], row[5], row[8], row[16], row[17], row[14], row[3]]
+	
+	skipped[reason] = skipped.get(reason, 0)+1
+	return None
+
+
+def writeChunk(rows):
+	file = tempfile.TemporaryFile('w+', encoding='UTF-8', newline='\n')
+	for row in rows:
+		file.write('\t'.join(row)+'\n')
+	file.seek(0)
+	return file
+
 
-processed_cities = []
-processed_countries = []
+def readChunk(file):
+	for line in file:
+		yield line.rstrip('\n').split('\t')
 
 
-with open('./cities15000.txt', 'r', encoding='UTF-8') as file:
-	reader = csv.reader(file, delimiter='\t')
-	for row in reader:
-		cities.append(row)
+def externalSort(rows, key, chunkRows):
+	"""
+	Yields rows (lists of strings without tabs nor line breaks) sorted by key, holding at most chunkRows of them in memory: they are
+	sorted by chunks, written to temporary files, then merged. As with sorted(), rows of equal keys keep their order.
+	"""
+	files = []
+	chunk = []
+	try:
+		for row in rows:
+			chunk.append(row)
+			if len(chunk) >= chunkRows:
+				files.append(writeChunk(sorted(chunk, key=key)))
+				chunk = []
 		
-with open('./countryInfo.txt', 'r', encoding='UTF-8') as file:
-	reader = csv.reader(file, delimiter='\t')
-	for row in reader:
-		countries.append(row)
+		if not files: # everything fitted in one chunk
+			yield from sorted(chunk, key=key)
+			return
 		
-# sort cities by population
-cities = sorted(cities, key=lambda x: int(x[14]), reverse=True)
-
-# removing useless data from cities
-for item in cities:
-	del item[18] # last update
-	del item[15] # elevation (we use "dem" ([16]) instead, as elevation is rarely provided)
-	del item[14] # population (we don't need it anymore)
-	del item[13] # admin4 code
-	del item[12] # admin3 code
-	del item[11] # admin2 code
-	del item[10] # admin1 code
-	del item[9] # alternate country code
-	del item[7] # feature code
-	del item[6] # feature class
-	del item[3] # alternate names
-
-for item in countries:
-	del item[18] # equivalent fips code
-	del item[17] # neighbors countries
-	del item[15] # language
-	del item[14] # postal code regex
-	del item[13] # postal code format
-	del item[12] # phone
-	del item[11] # currency name
-	del item[10] # currency code
-	del item[9] # tld
-	del item[8] # continent
-	del item[7] # population
-	del item[6] # area
-	del item[3] # fips
-	del item[2] # ISO-Numeric
-	
-with open('./cities.csv', 'w', encoding='UTF-8', newline='') as file:
-	writer = csv.writer(file, delimiter='\t')
-	writer.writerows(cities)
-
-with open('./countries.csv', 'w', encoding='UTF-8', newline='') as file:
-	writer = csv.writer(file, delimiter='\t')
-	writer.writerows(countries)
+		if chunk:
+			files.append(writeChunk(sorted(chunk, key=key)))
+			chunk = []
+		yield from heapq.merge(*(readChunk(file) for file in files), key=key)
+	finally:
+		for file in files:
+			file.close()
+
+
+def byPopulation(row):
+	return -int(row[8])
+
+
+def writeCities(path, rows):
+	"""
+	Writes rows (columns of city(), alternate names included) to cities.csv, most populous first.
+	Returns the row id of each geonameid, the set of the lowercase names and ASCII names, and the alternate names of each row.
+	"""
+	lines = {}
+	taken = set()
+	alternates = writeChunk([])
+	
+	with open(path, 'w', encoding='UTF-8', newline='') as file:
+		writer = csv.writer(file, delimiter='\t')
+		for i, row in enumerate(externalSort(rows, byPopulation, args.chunk_rows)):
+			writer.writerow(row[:9])
+			lines[row[0]] = i
+			taken.add(row[1].lower())
+			taken.add(row[2].lower())
+			alternates.write(row[9]+'\n')
+	
+	alternates.seek(0)
+	return lines, taken, alternates
+
+
+def addAliases(aliases, names, taken):
+	"""
+	Adds names (row id, alternate name), most populous cities first, to aliases: an alternate name is kept once, for the most populous
+	city, and only if it is not already the name of a city.
+	"""
+	for i, alternate in names:
+		if len(aliases) >= args.aliases_max:
+			break
+		alternate = alternate.strip().lower()
+		if alternate and alternate not in taken and alternate not in aliases:
+			aliases[alternate] = i
+
+
+def columnNames(alternates):
+	"""
+	Yields (row id, alternate name) from the alternate names of each row (as returned by writeCities()).
+	"""
+	for i, line in enumerate(alternates):
+		line = line.rstrip('\n')
+		if line:
+			for alternate in line.split(','):
+				yield i, alternate
+
+
+def languageNames(lines, languages):
+	"""
+	Yields (row id, alternate name) from alternateNamesV2.txt, for the cities of lines and these languages, most populous cities first.
+	"""
+	def names():
+		for row in readDump('./alternateNamesV2.txt'):
+			# alternateNameId, geonameid, isolanguage, alternate name, isPreferredName, isShortName, isColloquial, isHistoric, from, to
+			if len(row) > 7 and row[2] in languages and row[1] in lines and row[6] != '1' and row[7] != '1':
+				yield [str(lines[row[1]]), row[3]]
+	
+	for line, alternate in externalSort(names(), lambda row: int(row[0]), args.chunk_rows):
+		yield int(line), alternate
+
+
+def writeAliases(path, aliases):
+	with open(path, 'w', encoding='UTF-8', newline='') as file:
+		writer = csv.writer(file, delimiter='\t', quoting=csv.QUOTE_NONE, quotechar=None)
+		writer.writerows(sorted(aliases.items()))
+
+
+def build():
+	"""
+	Builds countries.csv, cities.csv and aliases.csv from the dumps.
+	"""
+	countries = []
+	
+	with open('./countryInfo.txt', 'r', encoding='UTF-8') as file:
+		reader = csv.reader(file, delimiter='\t')
+		for row in reader:
+			countries.append(row)
+	
+	for item in countries:
+		del item[18] # equivalent fips code
+		del item[17] # neighbors countries
+		del item[15] # language
+		del item[14] # postal code regex
+		del item[13] # postal code format
+		del item[12] # phone
+		del item[11] # currency name
+		del item[10] # currency code
+		del item[9] # tld
+		del item[8] # continent
+		del item[7] # population
+		del item[6] # area
+		del item[3] # fips
+		del item[2] # ISO-Numeric
+	
+	with open('./countries.csv', 'w', encoding='UTF-8', newline='') as file:
+		writer = csv.writer(file, delimiter='\t')
+		writer.writerows(countries)
+	
+	# cities sorted by population (the population is kept at the end, it is used to rank the suggestions for misspelled places)
+	cities = (city(row) for row in readDump(args.cities))
+	lines, taken, alternates = writeCities('./cities.csv', (row for row in cities if row is not None))
+	
+	# alternate names of each city, most populous cities first
+	aliases = {}
+	with alternates:
+		if args.aliases_languages:
+			addAliases(aliases, languageNames(lines, set(args.aliases_languages.split(','))), taken)
+		else:
+			addAliases(aliases, columnNames(alternates), taken)
+	
+	writeAliases('./aliases.csv', aliases)
+
+
+def update():
+	"""
+	Applies the daily modifications and deletions of GeoNames to the cities.csv and aliases.csv of the current directory.
+	"""
+	minimum = args.min_population
+	if minimum is None:
+		number = re.search(r"cities(\d+)", os.path.basename(args.cities))
+		minimum = int(number.group(1)) if number else 15000
+	
+	changes = {} # geonameid -> columns of city(), None if it is no longer a city
+	for path in args.modifications:
+		for row in readDump(path):
+			changes[row[0]] = city(row, minimum)
+	for path in args.deletes:
+		for row in readDump(path):
+			changes[row[0]] = None
+	
+	# the cities updated are ranked among the others by population: without it, they would all come before them
+	with open('./cities.csv', 'r', encoding='UTF-8', newline='') as file:
+		first = next(csv.reader(file, delimiter='\t'), [])
+	if len(first) < 9:
+		sys.exit('cities.csv has no population column (it was built by an older version of this script), the changes cannot be ranked among its cities. Rebuild it from the dump first (--cities, without --modifications nor --deletes), then apply the daily files.')
+	
+	formerIds = [] # geonameid of each row of the former cities.csv
+	
+	def cities(file):
+		for row in csv.reader(file, delimiter='\t'):
+			formerIds.append(row[0])
+			if row[0] in changes:
+				row = changes.pop(row[0]) # a modified city stays among those of the same population
+				if row is not None:
+					yield row
+			else:
+				yield row[:9]+[''] # its alternate names are in aliases.csv already
+		
+		for row in changes.values(): # new cities
+			if row is not None:
+				yield row
+	
+	with open('./cities.csv', 'r', encoding='UTF-8', newline='') as file:
+		lines, taken, alternates = writeCities('./cities.csv.new', cities(file))
+	
+	# alternate names of the cities kept, moved to their new rows, then those of the modified and new cities
+	aliases = {}
+	if os.path.exists('./aliases.csv'):
+		with open('./aliases.csv', 'r', encoding='UTF-8') as file:
+			for alternate, line in csv.reader(file, delimiter='\t', quoting=csv.QUOTE_NONE):
+				line = lines.get(formerIds[int(line)])
+				if line is not None and alternate not in taken:
+					aliases[alternate] = line
+	
+	with alternates:
+		addAliases(aliases, columnNames(alternates), taken)
+	
+	writeAliases('./aliases.csv.new', aliases)
+	os.replace('./cities.csv.new', './cities.csv')
+	os.replace('./aliases.csv.new', './aliases.csv')
+
+
+
+#--------------------------------------------------#
+# Script                                           #
+#--------------------------------------------------#
+
+if args.binary_only:
+	ailotime.Database('.').saveBinary('./ailotime.db')
+	sys.exit()
+
+if args.modifications or args.deletes:
+	update()
+else:
+	build()
+
+if skipped:
+	print('Rows skipped: '+', '.join('{} {}'.format(count, reason) for reason, count in sorted(skipped.items())), file=sys.stderr)
+
+# binary version, with the indexes
+ailotime.Database('.').saveBinary('./ailotime.db')
@@ -0,0 +1,93 @@
+#-------------------------------------------------------------------------------
+# Name:			writebehind
+# Purpose:		Writes the changes of a store of ailotime to SQLite behind, from a background thread
+#
+# Author:		Ailothaen (#3768)
+# Created:		october 2026
+#-------------------------------------------------------------------------------
+
+import logging
+import sqlite3
+import threading
+
+"""
+Shared by the stores kept in memory and written to SQLite (locations.py, reminders.py).
+
+- The store changes its memory at once, then tells the writer which rows changed (set()). A background thread writes the rows that
+  changed to the file every delay seconds, in one transaction: whoever changes the store never waits for the disk.
+- Only the last change of a row is written. How a row is written or deleted is up to the store (apply).
+- If writing fails, the changes are kept and tried again later, unless the row changed again meanwhile. close() writes what is left.
+"""
+
+logger = logging.getLogger('ailotime')
+
+
+
+#--------------------------------------------------#
+# Classes                                          #
+#--------------------------------------------------#
+
+class WriteBehind:
+	"""
+	Writes the rows of an SQLite file that changed every delay seconds: apply(connection, key, value) writes one of them, value being
+	None if it is to be deleted. schema is run when the file is opened; what names the rows in the logs.
+	"""
+	def __init__(self, path, schema, apply, what, delay=5):
+		self.path = path
+		self.apply = apply
+		self.what = what
+		self.delay = delay
+		self.pending = {} # key -> value to write, None to delete
+		self.lock = threading.Lock() # the store and the writer thread share pending
+		self.writing = threading.Lock() # one transaction at a time
+		self.stopped = threading.Event()
+		
+		self.connection = sqlite3.connect(path, check_same_thread=False)
+		with self.connection:
+			self.connection.execute(schema)
+		
+		self.thread = threading.Thread(target=self.loop, name=what, daemon=True)
+	
+	def start(self):
+		"""
+		Starts the writer thread, once the store has read the file.
+		"""
+		self.thread.start()
+	
+	def set(self, key, value):
+		"""
+		Marks a row to be written (None: to be deleted).
+		"""
+		with self.lock:
+			self.pending[key] = value
+	
+	def flush(self):
+		"""
+		Writes the changes to the file now.
+		"""
+		with self.writing:
+			with self.lock:
+				pending, self.pending = self.pending, {}
+			if not pending:
+				return
+			
+			try:
+				with self.connection: # one transaction
+					for key, value in pending.items():
+						self.apply(self.connection, key, value)
+			except sqlite3.Error as e:
+				logger.error('Cannot write the %s to %s (%s), trying again later', self.what, self.path, e)
+				with self.lock:
+					for key, value in pending.items():
+						self.pending.setdefault(key, value) # unless it changed again meanwhile
+	
+	def loop(self):
+		while not self.stopped.wait(self.delay):
+			self.flush()
+	
+	def close(self):
+		self.stopped.set()
+		if self.thread.is_alive():
+			self.thread.join()
+		self.flush()
+		self.connection.close()